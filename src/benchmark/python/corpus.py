@@ -0,0 +1,189 @@
+"""Generate a synthetic corpus of small, valid audio files
+
+Files are assembled byte by byte, so that even a million files can be
+created quickly and without any encoder. The audio is silent and only a few
+frames long, but every file can be read and written by mutagen.
+"""
+import os
+import struct
+
+from mutagen.ogg import OggPage
+
+
+FORMATS = ('mp3', 'flac', 'ogg', 'm4a')
+FILES_PER_DIRECTORY = 1000
+PADDING = 1024
+ARTWORK_SIZE = 32 * 1024
+VENDOR = b'usiq corpus'
+
+MP3_FRAME = b'\xff\xfb\x90\x64' + b'\x00' * 413  # MPEG-1 layer 3, 128 kbit/s
+MP3_FRAMES = 4
+JPEG = b'\xff\xd8\xff\xe0'
+ID3_FRAMES = {'title': b'TIT2',
+              'artist': b'TPE1',
+              'album': b'TALB',
+              'genre': b'TCON',
+              'albumartist': b'TPE2',
+              'bpm': b'TBPM',
+              'tracknumber': b'TRCK',
+              'year': b'TDRC',
+              'key': b'TKEY'}
+MP4_ATOMS = {'title': b'\xa9nam',
+             'artist': b'\xa9ART',
+             'album': b'\xa9alb',
+             'genre': b'\xa9gen',
+             'albumartist': b'aART',
+             'year': b'\xa9day'}
+GENRES = ('Techno', 'House', 'Ambient', 'Jazz', 'Rock')
+KEYS = tuple('{}{}'.format(number, mode)
+             for number in range(1, 13) for mode in 'AB')
+
+
+def tags_for(index):
+    return {'title': 'Title {:07d}'.format(index),
+            'artist': 'Artist {:04d}'.format(index % 997),
+            'album': 'Album {:05d}'.format(index // 12),
+            'genre': GENRES[index % len(GENRES)],
+            'albumartist': 'Artist {:04d}'.format(index % 997),
+            'bpm': str(80 + index % 100),
+            'key': KEYS[index % len(KEYS)],
+            'tracknumber': str(index % 12 + 1),
+            'year': str(1960 + index % 60)}
+
+
+def filename_for(index, fmt):
+    tags = tags_for(index)
+    name = '{}_-_{}.{}'.format(tags['artist'], tags['title'], fmt)
+    directory = 'd{:04d}'.format(index // FILES_PER_DIRECTORY)
+    return os.path.join(directory, name.replace(' ', '_'))
+
+
+def generate(directory, count, formats=FORMATS, artwork=False):
+    """Write count files to directory and return their names"""
+    builders = [BUILDERS[fmt] for fmt in formats]
+    cover = artwork_bytes() if artwork else None
+    fnames = []
+    for index in range(count):
+        fmt = formats[index % len(formats)]
+        fname = os.path.join(directory, filename_for(index, fmt))
+        if index % FILES_PER_DIRECTORY == 0:
+            os.makedirs(os.path.dirname(fname), exist_ok=True)
+        with open(fname, 'wb') as f:
+            f.write(builders[index % len(builders)](tags_for(index), cover))
+        fnames.append(fname)
+    return fnames
+
+
+def artwork_bytes(size=ARTWORK_SIZE):
+    return JPEG + bytes(range(256)) * ((size - len(JPEG)) // 256)
+
+
+def mp3(tags, cover=None):
+    frames = [id3_frame(ID3_FRAMES[key], b'\x03' + value.encode('utf-8'))
+              for key, value in sorted(tags.items())]
+    if cover is not None:
+        frames.append(id3_frame(b'APIC',
+                                b'\x00image/jpeg\x00\x03\x00' + cover))
+    body = b''.join(frames) + b'\x00' * PADDING
+    header = b'ID3\x04\x00\x00' + synchsafe(len(body))
+    return header + body + MP3_FRAME * MP3_FRAMES
+
+
+def id3_frame(name, data):
+    return name + synchsafe(len(data)) + b'\x00\x00' + data
+
+
+def synchsafe(value):
+    return bytes((value >> shift) & 0x7f for shift in (21, 14, 7, 0))
+
+
+def flac(tags, cover=None):
+    blocks = [(0, streaminfo()), (4, vorbis_comment(tags))]
+    if cover is not None:
+        blocks.append((6, flac_picture(cover)))
+    blocks.append((1, b'\x00' * PADDING))
+    data = bytearray(b'fLaC')
+    for i, (block_type, block) in enumerate(blocks):
+        if i == len(blocks) - 1:
+            block_type |= 0x80
+        data += bytes([block_type]) + struct.pack('>I', len(block))[1:]
+        data += block
+    return bytes(data) + b'\xff\xf8' + b'\x00' * 256
+
+
+def streaminfo():
+    # 44.1 kHz, stereo, 16 bit and one second of audio
+    info = (44100 << 44) | (1 << 41) | (15 << 36) | 44100
+    return (struct.pack('>HH', 4096, 4096) + b'\x00' * 6 +
+            struct.pack('>Q', info) + b'\x00' * 16)
+
+
+def vorbis_comment(tags, framing=False):
+    comments = ['{}={}'.format(key, value).encode('utf-8')
+                for key, value in sorted(tags.items())]
+    data = struct.pack('<I', len(VENDOR)) + VENDOR
+    data += struct.pack('<I', len(comments))
+    for comment in comments:
+        data += struct.pack('<I', len(comment)) + comment
+    return data + (b'\x01' if framing else b'')
+
+
+def flac_picture(cover):
+    mime = b'image/jpeg'
+    return (struct.pack('>II', 3, len(mime)) + mime +
+            struct.pack('>IIIIII', 0, 0, 0, 0, 0, len(cover)) + cover)
+
+
+def ogg(tags, cover=None):
+    # Artwork in Ogg Vorbis lives in a base64 comment and is left out
+    identification = (b'\x01vorbis' +
+                      struct.pack('<IBIiii', 0, 2, 44100, 0, 128000, 0) +
+                      b'\xb8\x01')
+    comment = b'\x03vorbis' + vorbis_comment(tags, framing=True)
+    setup = b'\x05vorbis' + b'\x00' * 32
+    pages = [ogg_page(0, [identification], first=True),
+             ogg_page(1, [comment, setup]),
+             ogg_page(2, [b'\x00' * 64], position=44100, last=True)]
+    return b''.join(page.write() for page in pages)
+
+
+def ogg_page(sequence, packets, position=0, first=False, last=False):
+    page = OggPage()
+    page.serial = 1
+    page.sequence = sequence
+    page.position = position
+    page.packets = packets
+    page.first = first
+    page.last = last
+    return page
+
+
+def m4a(tags, cover=None):
+    items = [atom(MP4_ATOMS[key], mp4_data(1, value.encode('utf-8')))
+             for key, value in sorted(tags.items()) if key in MP4_ATOMS]
+    items.append(atom(b'trkn', mp4_data(
+        0, struct.pack('>HHHH', 0, int(tags['tracknumber']), 12, 0))))
+    items.append(atom(b'tmpo', mp4_data(21, struct.pack('>H',
+                                                        int(tags['bpm'])))))
+    if cover is not None:
+        items.append(atom(b'covr', mp4_data(13, cover)))
+    handler = atom(b'hdlr', b'\x00' * 8 + b'mdirappl' + b'\x00' * 9)
+    ilst = atom(b'ilst', b''.join(items))
+    meta = atom(b'meta', b'\x00' * 4 + handler + ilst)
+    mvhd = atom(b'mvhd', (b'\x00' * 4 +
+                          struct.pack('>IIII', 0, 0, 1000, 1000) +
+                          b'\x00' * 80))
+    moov = atom(b'moov', mvhd + atom(b'udta', meta))
+    return (atom(b'ftyp', b'M4A \x00\x00\x00\x00M4A mp42isom') + moov +
+            atom(b'free', b'\x00' * PADDING) + atom(b'mdat', b'\x00' * 256))
+
+
+def mp4_data(kind, payload):
+    return atom(b'data', struct.pack('>II', kind, 0) + payload)
+
+
+def atom(name, data):
+    return struct.pack('>I', 8 + len(data)) + name + data
+
+
+BUILDERS = {'mp3': mp3, 'flac': flac, 'ogg': ogg, 'm4a': m4a}
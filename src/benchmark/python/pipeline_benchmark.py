@@ -0,0 +1,145 @@
+"""Time usiq's actions on a synthetic corpus
+
+Usage:
+    pipeline_benchmark.py [options]
+
+Every action runs in a fresh interpreter (including the time needed to
+import usiq) on a corpus generated by corpus.py. Throughput and peak
+resident memory of every action are reported as JSON.
+
+Options:
+    -n <N>, --files=<N>
+        number of files in the corpus [default: 1000]
+    --formats=<FORMATS>
+        comma separated list of formats [default: mp3,flac,ogg,m4a]
+    --artwork
+        embed cover art in every file
+    --show-files=<N>
+        number of files to run show on, one process each [default: 20]
+    --usiq-options=<OPTIONS>
+        options to pass to every usiq run, e.g. "--jobs=1 --bounded-read"
+    --directory=<DIR>
+        create the corpus in <DIR> and keep it (defaults to a temporary
+        directory that is removed afterwards)
+    -o <FILE>, --output=<FILE>
+        write the report to <FILE> [default: -]
+"""
+import os
+import sys
+import json
+import time
+import shlex
+import shutil
+import platform
+import tempfile
+import subprocess
+from docopt import docopt
+
+import corpus
+
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SOURCES = os.path.join(HERE, '..', '..', 'main', 'python')
+SCRIPT = os.path.join(HERE, '..', '..', 'main', 'scripts', 'usiq')
+
+# Runs in the child interpreter: argv is the report file followed by the
+# arguments for usiq
+MEASURE = """
+import sys, json, time, runpy, resource
+report, sys.argv = sys.argv[1], [{script!r}] + sys.argv[2:]
+start = time.perf_counter()
+runpy.run_path({script!r}, run_name='__main__')
+seconds = time.perf_counter() - start
+peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+           resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+with open(report, 'w') as f:
+    json.dump({{'seconds': seconds, 'peak_rss': peak}}, f)
+"""
+
+
+def run_usiq(args, workdir):
+    report = os.path.join(workdir, 'measurement.json')
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(
+        [SOURCES] + [p for p in [env.get('PYTHONPATH')] if p])
+    command = [sys.executable, '-c', MEASURE.format(script=SCRIPT), report]
+    subprocess.run(command + args, env=env, check=True,
+                   stdout=subprocess.DEVNULL)
+    with open(report) as f:
+        measurement = json.load(f)
+    if sys.platform == 'darwin':
+        # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+        measurement['peak_rss'] //= 1024
+    return measurement['seconds'], measurement['peak_rss']
+
+
+def result(files, seconds, peak_rss):
+    return {'files': files,
+            'seconds': round(seconds, 3),
+            'files_per_second': round(files / seconds, 1),
+            'peak_rss_kb': peak_rss}
+
+
+def benchmark(workdir, show_files, options, count):
+    library = os.path.join(workdir, 'corpus')
+    exported = os.path.join(workdir, 'tags.yaml')
+    base = ['--config={}'.format(os.path.join(workdir, 'usiqrc'))] + options
+    results = {}
+
+    seconds = peak = 0
+    for fname in show_files:
+        elapsed, rss = run_usiq(base + ['show', fname], workdir)
+        seconds += elapsed
+        peak = max(peak, rss)
+    results['show'] = result(len(show_files), seconds, peak)
+
+    steps = [
+        ('export', ['--recursive', library, '--output', exported, 'export']),
+        ('import', ['--recursive', library, '--import', exported, 'tag']),
+        ('tag', ['--recursive', library, '--pattern', '<artist>_-_<title>',
+                 '--genre', 'Benchmark', 'tag']),
+        ('rename', ['--recursive', library, '--pattern',
+                    os.path.join(workdir, 'renamed', '<artist>', '<album>',
+                                 '<title>'),
+                    'rename']),
+    ]
+    for name, args in steps:
+        results[name] = result(count, *run_usiq(base + args, workdir))
+    return results
+
+
+def main(args):
+    count = int(args['--files'])
+    formats = tuple(args['--formats'].split(','))
+    options = shlex.split(args['--usiq-options'] or '')
+    workdir = args['--directory'] or tempfile.mkdtemp(prefix='usiq-bench-')
+    try:
+        start = time.perf_counter()
+        fnames = corpus.generate(os.path.join(workdir, 'corpus'), count,
+                                 formats=formats,
+                                 artwork=args['--artwork'])
+        generated = time.perf_counter() - start
+        show_files = fnames[:int(args['--show-files'])]
+        results = benchmark(workdir, show_files, options, count)
+    finally:
+        if not args['--directory']:
+            shutil.rmtree(workdir)
+
+    report = {'python': platform.python_version(),
+              'platform': platform.platform(),
+              'corpus': {'files': count,
+                         'formats': formats,
+                         'artwork': args['--artwork'],
+                         'seconds': round(generated, 3)},
+              'usiq_options': options,
+              'results': results}
+    if args['--output'] == '-':
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+    else:
+        with open(args['--output'], 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main(docopt(__doc__))
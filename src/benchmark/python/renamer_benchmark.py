@@ -0,0 +1,82 @@
+import timeit
+
+from usiq import renamer
+
+
+PATTERN = '$HOME/Music/<albumartist>/<album>/<artist>_-_<title.upper>'
+TAGS = {'albumartist': 'Any Album Artist',
+        'album': 'Any Album [Deluxe Edition]',
+        'artist': 'Any Artist feat. Any Other Artist',
+        'title': 'Any "Title" (7" Version)'}
+
+# Tag values as they appear in real libraries: accents, quotes, brackets,
+# featured artists and characters that are not allowed in filenames
+STRINGS = ['Björk',
+           'Sigur Rós',
+           'Motörhead',
+           'Beyoncé feat. Jay-Z',
+           'AC/DC',
+           'Guns N\' Roses',
+           'Simon & Garfunkel',
+           'Hüsker Dü',
+           'What\'s the Story (Morning Glory)?',
+           'Back in Black [Remastered 2003]',
+           'Blue Monday \'88 (12" Version)',
+           'Dancing Queen - Live at Wembley "1979"',
+           'Ágætis byrjun',
+           '東京事変',
+           'Die Ärzte: Jazz ist anders <Deluxe>',
+           'Title 0001234']
+# Every track of an album repeats its artist and album
+TRACKS = [{'albumartist': STRINGS[i % 8],
+           'album': STRINGS[8 + i % 8],
+           'artist': STRINGS[i % 8],
+           'title': 'Track {:02d} {}'.format(i, STRINGS[i % len(STRINGS)])}
+          for i in range(64)]
+
+
+def per_file_cost(stmt, number=20000):
+    seconds = min(timeit.repeat(stmt, number=number, repeat=5))
+    return 1e6 * seconds / number
+
+
+def format_all(format_filename, charset):
+    for string in STRINGS:
+        format_filename(string, charset)
+
+
+def render_all(template):
+    for tags in TRACKS:
+        template.render(tags)
+
+
+def main():
+    template = renamer.compile_template(PATTERN)
+    costs = [
+        ('compile + render', lambda: renamer.Template(PATTERN).render(TAGS)),
+        ('render', lambda: template.render(TAGS)),
+    ]
+    for name, stmt in costs:
+        print('{:28s} {:8.2f} us/file'.format(name, per_file_cost(stmt)))
+
+    uncached = renamer.format_filename.__wrapped__
+    for charset in sorted(renamer.CHARSETS):
+        costs = [
+            ('format {}'.format(charset),
+             lambda: format_all(uncached, charset)),
+            ('format {} (memoized)'.format(charset),
+             lambda: format_all(renamer.format_filename, charset)),
+        ]
+        for name, stmt in costs:
+            cost = per_file_cost(stmt, number=2000) / len(STRINGS)
+            print('{:28s} {:8.2f} us/string'.format(name, cost))
+
+    for charset in sorted(renamer.CHARSETS):
+        album = renamer.compile_template(PATTERN, charset)
+        cost = per_file_cost(lambda: render_all(album), number=500)
+        print('{:28s} {:8.2f} us/file'.format('render album {}'.format(
+            charset), cost / len(TRACKS)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+import os
+import json
+from contextlib import contextmanager
+
+
+COMMIT_INTERVAL = 1000
+
+
+class TagCache(object):
+    """Sidecar database of tags keyed by (device, inode, size, mtime_ns)
+
+    Entries are stored per (device, inode), so renaming a file keeps its
+    entry valid, and size and modification time decide whether the entry
+    is still current.
+    """
+
+    def __init__(self, fname):
+        import sqlite3
+        self.connection = sqlite3.connect(os.path.expanduser(fname))
+        self.connection.execute('CREATE TABLE IF NOT EXISTS tags ('
+                                'device INTEGER, '
+                                'inode INTEGER, '
+                                'size INTEGER, '
+                                'mtime_ns INTEGER, '
+                                'tags TEXT, '
+                                'PRIMARY KEY (device, inode))')
+        self.pending = 0
+
+    def key(self, fname):
+        try:
+            st = os.stat(fname)
+        except OSError:
+            return None
+        return (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+
+    def get(self, key):
+        if key is None:
+            return None
+        row = self.connection.execute(
+            'SELECT size, mtime_ns, tags FROM tags '
+            'WHERE device = ? AND inode = ?', key[:2]).fetchone()
+        if row is None or tuple(row[:2]) != key[2:]:
+            return None
+        return json.loads(row[2])
+
+    def put(self, key, tags):
+        if key is None:
+            return
+        self.connection.execute('INSERT OR REPLACE INTO tags '
+                                'VALUES (?, ?, ?, ?, ?)',
+                                key + (json.dumps(tags),))
+        self.pending += 1
+        if self.pending >= COMMIT_INTERVAL:
+            self.commit()
+
+    def commit(self):
+        self.connection.commit()
+        self.pending = 0
+
+    def close(self):
+        self.commit()
+        self.connection.close()
+
+
+@contextmanager
+def open_cache(fname):
+    if not fname:
+        yield None
+        return
+    cache = TagCache(fname)
+    try:
+        yield cache
+    finally:
+        cache.close()
@@ -1,18 +1,54 @@
 import os
 import sys
-import yaml
 from contextlib import contextmanager
-from logbook import info, warning
+from functools import partial
+from logbook import debug, info, warning
 
-from usiq import tagger, parser, renamer
+from usiq import (tagger, parser, renamer, parallel, cache, planner,
+                  journal, timing, discover)
+
+
+READ_CHUNKSIZE = 64
 
 
 class UsiqError(Exception):
     pass
 
 
-def show(fname):
-    info(tagger.get_tagger(fname))
+def run(args):
+    fnames = discover.find_files(args.pop('<FILE>'),
+                                 recursive=args['--recursive'],
+                                 files_from=args['--files-from'],
+                                 sniff=args['--sniff'])
+    with timing.profiled(args['--profile'], args['--cprofile'],
+                         slowest=int(args['--slowest'])):
+        if args['show']:
+            show(next(fnames),
+                 bounded=args['--bounded-read'],
+                 sniff=args['--sniff'],
+                 fields=args['--fields'])
+        elif args['tag']:
+            tag(fnames, args)
+        elif args['rename']:
+            rename(fnames, args)
+        elif args['copy']:
+            copy(fnames, args)
+        elif args['export']:
+            export(fnames, args)
+        elif args['apply']:
+            apply(args['<PLAN>'], args)
+        elif args['undo']:
+            undo(args['<JOURNAL>'], args)
+        elif args['watch']:
+            watch(args['<DIR>'], args)
+        elif args['find']:
+            find(fnames, args['<QUERY>'], args)
+
+
+def show(fname, bounded=False, sniff=False, fields=None):
+    fields = parse_fields(fields)
+    found = tagger.get_tagger(fname, bounded=bounded, sniff=sniff)
+    info(found if fields is None else found.todict(fields))
 
 
 def tag(fnames, args):
@@ -20,67 +56,402 @@ def tag(fnames, args):
                     for key in tagger.FIELDS
                     if '--' + key in args and args['--' + key] is not None}
 
-    if args['--import']:
-        with open_file_or_stdinout(args['--import']) as f:
-            filetags = yaml.load(f)
+    if args['--pattern']:
+        pattern = parser.compile_pattern(args['--pattern'])
     else:
-        filetags = {}
+        pattern = None
 
-    for fname in fnames:
-        abs_fname = os.path.abspath(fname)
-        tags = filetags[abs_fname] if abs_fname in filetags else {}
+    if args.get('--resume'):
+        progress = journal.read_journal(args['--resume'])
+        fnames = (fname for fname in fnames
+                  if not progress.is_done('tag', fname))
+
+    jobs = parallel.num_jobs(args.get('--jobs', 1))
+    with imported_tags(args) as filetags:
+        planned = plan_tags(recognized(fnames, args), pattern, default_tags,
+                            filetags)
+        if args['--dry']:
+            for _ in planned:
+                pass
+            return
+
+        write = partial(write_tags, padding=padding_bytes(args))
+        in_place = rewritten = skipped = 0
+        with cache.open_cache(args.get('--cache')) as tag_cache, \
+                journal.open_journal(journal_name(args)) as log:
+            if log is not None:
+                planned = journaled(planned, log)
+            for (fname, _, _), saved, error in parallel.imap(write, planned,
+                                                             jobs):
+                if error:
+                    warning('Could not set tags on {}: {}'
+                            .format(fname, error))
+                    continue
+                if saved is None:
+                    skipped += 1
+                else:
+                    tags, full_rewrite = saved
+                    if full_rewrite:
+                        rewritten += 1
+                    else:
+                        in_place += 1
+                    if tag_cache is not None:
+                        tag_cache.put(tag_cache.key(fname), tags)
+                if log is not None:
+                    log.done('tag', fname)
+        debug('Wrote tags to {} files ({} in place, {} rewritten), '
+              '{} files were unchanged'
+              .format(in_place + rewritten, in_place, rewritten, skipped))
+
+
+@contextmanager
+def imported_tags(args):
+    from usiq import tagfile
+    if not args['--import']:
+        yield tagfile.TagLookup(())
+        return
+    fmt = tagfile.guess_format(args['--import'], args.get('--format'))
+    mode = 'rb' if tagfile.is_binary(fmt) else 'r'
+    with open_file_or_stdinout(args['--import'], mode) as f:
+        yield tagfile.TagLookup(tagfile.read_entries(f, fmt))
+
+
+def plan_tags(recognized, pattern, default_tags, filetags):
+    for fname, tagr in recognized:
+        started = timing.start()
+        tags = filetags.pop(os.path.abspath(fname))
+        timing.stop('import', started, fname)
         tags.update(default_tags.copy())
-        if args['--pattern']:
-            tags.update(parser.parse_filename(fname, args['--pattern']))
+        if pattern is not None:
+            parsed = pattern.match(fname)
+            if parsed is None:
+                warning('Skipping {}: it does not match the pattern {}'
+                        .format(fname, pattern.pattern))
+                continue
+            tags.update(parsed)
 
         info('Setting tags {} on file {}'.format(tags, fname))
-        if not args['--dry']:
-            tagger.set_multiple_tags(fname, tags, prefix='')
+        yield fname, tags, tagr
+
+
+def journaled(planned, log):
+    for fname, tags, tagr in planned:
+        log.planned('tag', fname, tags=tags)
+        yield fname, tags, tagr
+
+
+def write_tags(job, padding=None):
+    fname, tags, tagr = job
+    saved = tagger.set_multiple_tags(fname, tags, prefix='', padding=padding,
+                                     tagr=tagr)
+    if saved is None:
+        return None
+    return saved.todict(), saved.rewritten
+
+
+def padding_bytes(args):
+    if args.get('--padding') is None:
+        return None
+    return int(float(args['--padding']) * 1024)
 
 
-def rename(fnames, args):
+def rename(fnames, args, copy=False):
+    # Resuming replays the journaled plan, which needs no pattern
+    if args.get('--resume'):
+        resume_renames(args['--resume'], args, copy)
+        return
+
     pattern = args['--pattern']
     if illegal_pattern(pattern):
         raise UsiqError('Illegal pattern, aborting')
 
+    template = renamer.compile_template(pattern, charset_name(args))
+    with cache.open_cache(args.get('--cache')) as tag_cache:
+        plan = planner.plan_renames(read_all(fnames, args, tag_cache),
+                                    template,
+                                    copy=copy)
+    if args.get('--save-plan'):
+        with open_file_or_stdinout(args['--save-plan'], 'w') as f:
+            plan.dump(f)
+    apply_journaled(plan, args)
+
+
+def copy(fnames, args):
+    rename(fnames, args, copy=True)
+
+
+def apply(plan_fname, args):
+    with open_file_or_stdinout(plan_fname) as f:
+        plan = planner.RenamePlan.load(f)
+    apply_journaled(plan, args, verify=True)
+
+
+def resume_renames(journal_fname, args, copy=False):
+    # The whole plan is journaled before the first file is moved, so no
+    # tags need to be read again. Sources that are gone have been moved
+    # after the last sync of the journal.
+    op = 'copy' if copy else 'rename'
+    pending = journal.read_journal(journal_fname).pending(op)
+    plan = planner.RenamePlan(((entry['path'], entry['target'])
+                               for entry in pending
+                               if os.path.exists(entry['path'])),
+                              copy=copy)
+    for source, target in plan.moves:
+        remove_incomplete(source, target, dry=args['--dry'])
+    with journal.open_journal(journal_name(args)) as log:
+        planner.apply_plan(plan, dry=args['--dry'], verify=True,
+                           journal=log)
+
+
+def remove_incomplete(source, target, dry=False):
+    """Remove a target that an interrupted copy left shorter than source"""
+    try:
+        if os.path.getsize(target) == os.path.getsize(source):
+            return
+    except FileNotFoundError:
+        return
+    warning('Redoing {} -> {}, the target is incomplete'
+            .format(source, target))
+    if not dry:
+        os.unlink(target)
+
+
+def apply_journaled(plan, args, verify=False):
+    with journal.open_journal(journal_name(args)) as log:
+        if log is not None:
+            op = 'copy' if plan.copy else 'rename'
+            for source, target in plan.moves:
+                log.planned(op, source, target=os.path.abspath(target))
+            log.sync()
+        planner.apply_plan(plan, dry=args['--dry'], verify=verify,
+                           journal=log)
+
+
+def undo(journal_fname, args):
+    done = journal.read_journal(journal_fname).completed('rename')
+    plan = planner.RenamePlan((entry['target'], entry['path'])
+                              for entry in reversed(done))
+    apply_journaled(plan, args, verify=True)
+
+
+def watch(directory, args):
+    from usiq import watch as watcher
+    target = args.get('--target')
+    if target and illegal_pattern(target):
+        raise UsiqError('Illegal target pattern, aborting')
+    if target:
+        template = renamer.compile_template(target, charset_name(args))
+    else:
+        template = None
+    if args['--pattern']:
+        pattern = parser.compile_pattern(args['--pattern'])
+    else:
+        pattern = None
+    debounce = float(args.get('--debounce') or watcher.DEBOUNCE)
+    jobs = parallel.num_jobs(args.get('--jobs', 1))
+
+    incoming = watcher.Watcher(directory, sniff=args.get('--sniff', False))
+    info('Watching {} for new files'.format(directory))
+    try:
+        for fnames in incoming.batches(debounce):
+            if pattern is not None:
+                fnames = matching(fnames, pattern)
+            if not fnames:
+                continue
+            info('Processing {} new files'.format(len(fnames)))
+            written = set(fnames)
+            try:
+                process_batch(fnames, args, template, written, jobs)
+            except Exception as err:
+                # A bad batch must not stop the watcher
+                warning('Could not process {} new files: {}: {}'
+                        .format(len(fnames), type(err).__name__, err))
+            # Events caused by usiq itself must not start another batch
+            incoming.discard(written)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        incoming.close()
+
+
+def matching(fnames, pattern):
+    matched = []
     for fname in fnames:
-        tags = tagger.get_tagger(fname)
-        new_fname = renamer.create_filename(tags, pattern)
-        _, extension = os.path.splitext(fname)
-        new_fname += extension
-        target_exists = os.path.exists(new_fname)
-        if target_exists:
-            warning('Not moving {} -> {}, target file exists!'
-                    .format(fname, new_fname))
-            continue
-        info('Moving {} -> {}'.format(fname, new_fname))
-        if not args['--dry']:
-            os.makedirs(os.path.dirname(new_fname), exist_ok=True)
-            os.rename(fname, new_fname)
+        if pattern.match(fname) is None:
+            warning('Leaving {} alone, it does not match the pattern {}'
+                    .format(fname, pattern.pattern))
+        else:
+            matched.append(fname)
+    return matched
+
+
+def process_batch(fnames, args, template, written, jobs):
+    batch_args = dict(args, **{'--jobs': min(jobs, len(fnames))})
+    tag(fnames, batch_args)
+    if template is not None:
+        plan = planner.plan_renames(read_all(fnames, batch_args), template)
+        written.update(os.path.abspath(target) for _, target in plan.moves)
+        apply_journaled(plan, batch_args)
+
+
+def journal_name(args):
+    if args.get('--dry'):
+        return None
+    return args.get('--journal') or args.get('--resume')
 
 
 def export(fnames, args):
+    from usiq import tagfile
     outfile = args['--output']
-    with open_file_or_stdinout(outfile, 'w') as f:
-        yaml.dump({os.path.abspath(fname): tagger.get_tagger(fname).todict()
-                   for fname in fnames},
-                  f,
-                  default_flow_style=False)
+    fmt = tagfile.guess_format(outfile, args.get('--format'))
+    compression = tagfile.guess_compression(outfile, args.get('--compress'))
+    mode = 'wb' if tagfile.is_binary(fmt) else 'w'
+    with cache.open_cache(args.get('--cache')) as tag_cache, \
+            open_file_or_stdinout(outfile, mode) as f:
+        writer = tagfile.get_writer(f, fmt, compression)
+        fields = parse_fields(args.get('--fields'))
+        for fname, tags in read_all(fnames, args, tag_cache, fields):
+            started = timing.start()
+            writer.write(os.path.abspath(fname), tags)
+            timing.stop('serialize', started, fname)
+        started = timing.start()
+        writer.close()
+        timing.stop('serialize', started)
+
+
+def find(fnames, query, args):
+    from usiq import index
+    predicates = index.parse_query(query)
+    with indexed_entries(fnames, args) as entries:
+        started = timing.start()
+        tag_index = index.TagIndex(entries)
+        timing.stop('index', started)
+    started = timing.start()
+    matches = tag_index.find(predicates)
+    timing.stop('query', started)
+    for path in matches:
+        print(path)
+    debug('{} of {} files match'.format(len(matches), len(tag_index)))
+
+
+@contextmanager
+def indexed_entries(fnames, args):
+    if not args['--import']:
+        with cache.open_cache(args.get('--cache')) as tag_cache:
+            yield read_all(fnames, args, tag_cache)
+        return
+    from usiq import tagfile
+    fmt = tagfile.guess_format(args['--import'], args.get('--format'))
+    mode = 'rb' if tagfile.is_binary(fmt) else 'r'
+    with open_file_or_stdinout(args['--import'], mode) as f:
+        yield tagfile.read_entries(f, fmt)
+
+
+def read_all(fnames, args, tag_cache=None, fields=None):
+    jobs = parallel.num_jobs(args.get('--jobs', 1))
+    read = partial(read_tags,
+                   bounded=args.get('--bounded-read', False),
+                   fields=fields)
+    items = lookup_cached(recognized(fnames, args), tag_cache)
+    depth = int(args.get('--prefetch') or 0)
+    if depth:
+        # Tags are parsed in this process while the threads wait for I/O
+        items = prefetch_regions(items, depth)
+        jobs = 1
+    for (fname, _, key, cached, _), tags, error in parallel.imap(
+            read, items, jobs, chunksize=READ_CHUNKSIZE):
+        if error:
+            warning('Could not read tags from {}: {}'.format(fname, error))
+            continue
+        # Only complete entries are cached
+        if tag_cache is not None and cached is None and fields is None:
+            tag_cache.put(key, tags)
+        yield fname, tags
+
+
+def lookup_cached(recognized, tag_cache):
+    for fname, tagr in recognized:
+        if tag_cache is None:
+            yield fname, tagr, None, None, None
+        else:
+            started = timing.start()
+            key = tag_cache.key(fname)
+            cached = tag_cache.get(key)
+            timing.stop('cache', started, fname)
+            yield fname, tagr, key, cached, None
+
+
+def prefetch_regions(items, depth):
+    for (fname, tagr, key, cached, _), region in parallel.prefetch(
+            fetch_region, items, depth):
+        yield fname, tagr, key, cached, region
+
+
+def fetch_region(item):
+    fname, tagr, _, cached, _ = item
+    if cached is not None:
+        return None
+    return tagger.read_ahead(fname, tagr=tagr)
+
+
+def read_tags(item, bounded=False, fields=None):
+    fname, tagr, _, cached, region = item
+    if cached is not None:
+        if fields is None:
+            return cached
+        return {key: cached.get(key) for key in fields}
+    if region is None:
+        found = tagger.get_tagger(fname, bounded=bounded, tagr=tagr)
+    else:
+        started = timing.start()
+        prefetched = region.result()
+        timing.stop('prefetch_wait', started, fname)
+        found = tagger.get_tagger(fname, prefetched=prefetched)
+    if fields is None:
+        return found.todict()
+    return found.todict(fields)
+
+
+def parse_fields(value):
+    if not value:
+        return None
+    fields = tuple(field.strip() for field in value.split(','))
+    for field in fields:
+        if field not in tagger.FIELDS:
+            raise UsiqError('Unknown field {}, valid fields are {}'
+                            .format(field, ', '.join(tagger.FIELDS)))
+    return fields
+
+
+def charset_name(args):
+    name = args.get('--charset') or renamer.DEFAULT_CHARSET
+    if name not in renamer.CHARSETS:
+        raise UsiqError('Unknown charset {}, valid charsets are {}'
+                        .format(name, ', '.join(sorted(renamer.CHARSETS))))
+    return name
+
+
+def recognized(fnames, args):
+    # Formats are only detected up front when sniffing, extensions are
+    # looked up when each file is opened
+    if args.get('--sniff'):
+        return tagger.recognize(fnames, sniff=True)
+    return ((fname, None) for fname in fnames)
 
 
 def illegal_pattern(pattern):
+    if not pattern:
+        return True
     constant = len(parser.get_fields(pattern)) == 0
     _, extension = os.path.splitext(pattern)
     has_extension = extension.lower() in ['.mp3', '.flac', '.ogg', '.m4a']
     return constant or has_extension
 
 
-def with_config(args):
-    if os.path.exists(args['--config']):
-        with open(args['--config']) as f:
-            cfg = yaml.load(f)
-    else:
-        cfg = {}
+def with_config(args, cfg=None):
+    if cfg is None:
+        cfg = load_config(args['--config'])
+    cfg = dict(cfg)
     for key, value in args.items():
         if key not in cfg:
             cfg[key] = value
@@ -89,15 +460,24 @@ def with_config(args):
     return cfg
 
 
+def load_config(fname):
+    if not os.path.exists(fname):
+        return {}
+    import yaml
+    with open(fname) as f:
+        return yaml.load(f)
+
+
 @contextmanager
 def open_file_or_stdinout(fname, mode='r', **kwargs):
     if fname == '-':
         if 'r' in mode:
-            yield sys.stdin
+            stream = sys.stdin
         elif 'w' in mode or 'a' in mode:
-            yield sys.stdout
+            stream = sys.stdout
         else:
-            yield sys.stdin
+            stream = sys.stdin
+        yield stream.buffer if 'b' in mode else stream
     else:
         f = open(fname, mode, **kwargs)
         yield f
@@ -0,0 +1,41 @@
+import os
+import sys
+import json
+import socket
+
+
+def default_socket():
+    directory = (os.environ.get('XDG_RUNTIME_DIR') or
+                 os.environ.get('TMPDIR') or '/tmp')
+    return (os.environ.get('USIQ_SOCKET') or
+            os.path.join(directory, 'usiq-{}.sock'.format(os.getuid())))
+
+
+def send(f, message):
+    f.write(json.dumps(message).encode('utf-8') + b'\n')
+    f.flush()
+
+
+def request(argv, path=None, out=None):
+    """Run usiq with argv in the server and return its exit status"""
+    out = out or sys.stdout
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    with connection:
+        connection.connect(path or default_socket())
+        with connection.makefile('rwb') as f:
+            send(f, {'argv': argv, 'cwd': os.getcwd()})
+            for line in f:
+                message = json.loads(line.decode('utf-8'))
+                if 'status' in message:
+                    return message['status']
+                out.write(message['output'])
+                out.flush()
+    return 1
+
+
+def main(argv):
+    try:
+        return request(argv)
+    except OSError as err:
+        sys.stderr.write('Could not reach usiq server: {}\n'.format(err))
+        return 2
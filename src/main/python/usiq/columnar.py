@@ -0,0 +1,152 @@
+import sys
+import gzip
+import struct
+from array import array
+from itertools import accumulate, chain
+
+from .tagger import FIELDS
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+MAGIC = b'USIQCOL1'
+HEADER = struct.Struct('<III')
+GZIP_MAGIC = b'\x1f\x8b'
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+COMPRESSIONS = ('gzip', 'zstd')
+GZIP_LEVEL = 6
+
+STR = 0
+INT = 1
+
+
+class ColumnarError(Exception):
+    pass
+
+
+class ColumnarWriter(object):
+    """Collect tags in one array per field and write them on close
+
+    Layout (little endian): magic, number of strings, rows and fields, the
+    string table (offsets, type codes, utf-8 data), one string id per field
+    name, one per path and then one column of string ids per field with -1
+    for missing values.
+    """
+
+    def __init__(self, f, compression=None):
+        if compression is not None:
+            check_compression(compression)
+        self.f = f
+        self.compression = compression
+        self.strings = {}
+        self.values = []
+        self.paths = array('i')
+        self.columns = [(field, array('i')) for field in FIELDS]
+
+    def intern(self, value):
+        if value is None:
+            return -1
+        index = self.strings.get(value)
+        if index is None:
+            index = self.strings[value] = len(self.values)
+            self.values.append(value)
+        return index
+
+    def write(self, path, tags):
+        intern = self.intern
+        self.paths.append(intern(path))
+        for field, column in self.columns:
+            column.append(intern(tags.get(field)))
+
+    def close(self):
+        names = array('i', (self.intern(field) for field, _ in self.columns))
+        data = bytearray(MAGIC)
+        data += HEADER.pack(len(self.values),
+                            len(self.paths),
+                            len(self.columns))
+        data += string_table(self.values)
+        for values in [names, self.paths] + [c for _, c in self.columns]:
+            data += to_little_endian(values)
+        self.f.write(compress(bytes(data), self.compression))
+        self.f.flush()
+
+
+def string_table(values):
+    encoded = [str(value).encode('utf-8') for value in values]
+    offsets = array('I', accumulate(chain([0], map(len, encoded))))
+    types = bytes(INT if type(value) is int else STR for value in values)
+    return to_little_endian(offsets) + types + b''.join(encoded)
+
+
+def read_entries(f):
+    data = decompress(f.read())
+    if not data.startswith(MAGIC):
+        raise ColumnarError('Not a columnar tag file')
+    nstrings, nrows, nfields = HEADER.unpack_from(data, len(MAGIC))
+    position = len(MAGIC) + HEADER.size
+
+    offsets, position = from_little_endian('I', data, position, nstrings + 1)
+    types = data[position:position + nstrings]
+    position += nstrings
+    blob = data[position:position + offsets[-1]]
+    position += offsets[-1]
+    strings = [blob[start:end].decode('utf-8')
+               for start, end in zip(offsets, offsets[1:])]
+    for i, kind in enumerate(types):
+        if kind == INT:
+            strings[i] = int(strings[i])
+    strings.append(None)  # index -1 reads as missing
+
+    names, position = from_little_endian('i', data, position, nfields)
+    paths, position = from_little_endian('i', data, position, nrows)
+    columns = []
+    for name in names:
+        column, position = from_little_endian('i', data, position, nrows)
+        columns.append((strings[name], column))
+
+    for row, path in enumerate(paths):
+        yield strings[path], {field: strings[column[row]]
+                              for field, column in columns}
+
+
+def to_little_endian(values):
+    if sys.byteorder == 'big':
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def from_little_endian(typecode, data, position, count):
+    values = array(typecode)
+    end = position + count * values.itemsize
+    values.frombytes(data[position:end])
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values, end
+
+
+def check_compression(compression):
+    if compression not in COMPRESSIONS:
+        raise ColumnarError('Unknown compression {}'.format(compression))
+    if compression == 'zstd' and zstandard is None:
+        raise ColumnarError('zstd compression requires the zstandard package')
+
+
+def compress(data, compression):
+    if compression == 'gzip':
+        return gzip.compress(data, GZIP_LEVEL)
+    elif compression == 'zstd':
+        return zstandard.ZstdCompressor().compress(data)
+    return data
+
+
+def decompress(data):
+    if data.startswith(GZIP_MAGIC):
+        return gzip.decompress(data)
+    elif data.startswith(ZSTD_MAGIC):
+        check_compression('zstd')
+        return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+    return data
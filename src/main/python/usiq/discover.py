@@ -0,0 +1,68 @@
+import os
+import sys
+from itertools import chain
+
+from .tagger import EXTENSIONS
+
+
+READ_SIZE = 65536
+
+
+def find_files(fnames, recursive=None, files_from=None, sniff=False):
+    """Chain the given, discovered and listed files
+
+    Discovered and listed files are filtered by extension, unless their
+    content is sniffed later on anyway.
+    """
+    sources = [fnames]
+    if recursive:
+        sources.append(walk(recursive, sniff=sniff))
+    if files_from:
+        listed = read_file_list(files_from)
+        sources.append(listed if sniff else supported_only(listed))
+    return chain.from_iterable(sources)
+
+
+def walk(directory, sniff=False):
+    pending = [directory]
+    while pending:
+        directory = pending.pop()
+        subdirectories = []
+        for entry in sorted(os.scandir(directory), key=lambda e: e.name):
+            if entry.is_dir(follow_symlinks=False):
+                subdirectories.append(entry.path)
+            elif entry.is_file() and (sniff or is_supported(entry.name)):
+                yield entry.path
+        pending.extend(reversed(subdirectories))
+
+
+def read_file_list(fname):
+    if fname == '-':
+        yield from split_nul(sys.stdin.buffer)
+    else:
+        with open(fname, 'rb') as f:
+            yield from split_nul(f)
+
+
+def split_nul(stream):
+    rest = b''
+    while True:
+        data = stream.read(READ_SIZE)
+        if not data:
+            break
+        names = (rest + data).split(b'\0')
+        rest = names.pop()
+        for name in names:
+            if name:
+                yield os.fsdecode(name)
+    if rest:
+        yield os.fsdecode(rest)
+
+
+def supported_only(fnames):
+    return (fname for fname in fnames if is_supported(fname))
+
+
+def is_supported(fname):
+    _, extension = os.path.splitext(fname)
+    return extension.lower() in EXTENSIONS
@@ -0,0 +1,124 @@
+import os
+import errno
+import shutil
+import tempfile
+from logbook import debug
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+# ioctl request for cloning a file on btrfs, xfs and other CoW filesystems
+FICLONE = 0x40049409
+BUFFER_SIZE = 1024 * 1024
+CHUNK_SIZE = 1 << 30
+UNSUPPORTED = {errno.EXDEV, errno.EINVAL, errno.ENOSYS, errno.EOPNOTSUPP,
+               errno.ENOTTY, errno.EBADF, errno.EPERM}
+
+
+def move_file(source, target):
+    try:
+        os.rename(source, target)
+    except OSError as err:
+        if err.errno != errno.EXDEV:
+            raise
+        copy_file(source, target)
+        os.unlink(source)
+
+
+def copy_file(source, target):
+    """Copy source to target, which must not exist yet
+
+    The content is copied to a temporary file next to target first, so an
+    interrupted copy never leaves a partial file under the target's name.
+    """
+    if os.path.lexists(target):
+        raise FileExistsError(errno.EEXIST, os.strerror(errno.EEXIST),
+                              target)
+    directory, basename = os.path.split(target)
+    fd, partial = tempfile.mkstemp(prefix='.{}.'.format(basename),
+                                   suffix='.part', dir=directory or '.')
+    try:
+        with open(source, 'rb') as src, os.fdopen(fd, 'wb') as dst:
+            size = os.fstat(src.fileno()).st_size
+            method = copy_content(src, dst, size)
+            dst.flush()
+            copied = os.fstat(dst.fileno()).st_size
+            if copied != size:
+                raise OSError(errno.EIO, 'Copied only {} of {} bytes'
+                              .format(copied, size), source)
+        shutil.copystat(source, partial)
+        link_into_place(partial, target)
+    except BaseException:
+        # A partial copy would be taken for a finished one later on
+        if os.path.lexists(partial):
+            os.unlink(partial)
+        raise
+    debug('Copied {} -> {} using {}'.format(source, target, method))
+
+
+def link_into_place(partial, target):
+    # Unlike rename, link never replaces a file that appeared meanwhile
+    try:
+        os.link(partial, target)
+    except OSError as err:
+        if err.errno not in UNSUPPORTED:
+            raise
+        if os.path.lexists(target):
+            raise FileExistsError(errno.EEXIST, os.strerror(errno.EEXIST),
+                                  target)
+        os.rename(partial, target)
+        return
+    os.unlink(partial)
+
+
+def copy_content(src, dst, size):
+    for method in (reflink, copy_range, send_file):
+        if method(src.fileno(), dst.fileno(), size):
+            return method.__name__
+    shutil.copyfileobj(src, dst, BUFFER_SIZE)
+    return 'copyfileobj'
+
+
+def reflink(src, dst, size):
+    if fcntl is None:
+        return False
+    try:
+        fcntl.ioctl(dst, FICLONE, src)
+    except OSError as err:
+        if err.errno in UNSUPPORTED:
+            return False
+        raise
+    return True
+
+
+def copy_range(src, dst, size):
+    if not hasattr(os, 'copy_file_range'):
+        return False
+    return copy_loop(lambda: os.copy_file_range(src, dst, CHUNK_SIZE), size)
+
+
+def send_file(src, dst, size):
+    if not hasattr(os, 'sendfile'):
+        return False
+    return copy_loop(lambda: os.sendfile(dst, src, None, CHUNK_SIZE), size)
+
+
+def copy_loop(copy_chunk, size):
+    # Only the first chunk may fail over to the next method, nothing has
+    # been written at that point
+    try:
+        copied = copy_chunk()
+    except OSError as err:
+        if err.errno in UNSUPPORTED:
+            return False
+        raise
+    if not copied and size:
+        # Some filesystems (e.g. FUSE or procfs) report an empty file
+        # instead of an error
+        return False
+    while copied:
+        copied = copy_chunk()
+    return True
@@ -0,0 +1,174 @@
+import re
+from bisect import bisect_left, bisect_right
+
+from .tagger import FIELDS
+
+
+# Fields with range queries, everything else is looked up by value
+NUMERIC = ('bpm', 'year', 'tracknumber')
+# Years like "1999-05-01", track numbers like "3/12" and bpm like "120.5"
+NUMBER = re.compile(r'\s*(\d+(?:\.\d+)?)')
+PREDICATE = re.compile(r'^(\w+)(:|~)(.*)$')
+
+
+class QueryError(Exception):
+    pass
+
+
+class TagIndex(object):
+    """Tags of many files, indexed for lookups by value, range or substring
+
+    Every field is kept as a column with one (lowercased or numeric) value
+    per file. Numeric fields are also sorted for bisection, the other fields
+    map each distinct value to its rows. A query starts from the predicate
+    with the fewest candidate rows and checks the others row by row.
+    """
+
+    def __init__(self, entries):
+        self.paths = []
+        self.columns = {field: [] for field in FIELDS}
+        appenders = [(field,
+                      self.columns[field].append,
+                      number if field in NUMERIC else Lowercase())
+                     for field in FIELDS]
+        for path, tags in entries:
+            self.paths.append(path)
+            for field, append, convert in appenders:
+                append(convert(tags.get(field)))
+        self.numbers = {field: self.sort(self.columns[field])
+                        for field in NUMERIC}
+        self.values = {field: self.group(self.columns[field])
+                       for field in FIELDS if field not in NUMERIC}
+
+    @staticmethod
+    def sort(column):
+        rows = sorted((row for row, value in enumerate(column)
+                       if value is not None), key=column.__getitem__)
+        return [column[row] for row in rows], rows
+
+    @staticmethod
+    def group(column):
+        rows = {}
+        for row, value in enumerate(column):
+            if value is not None:
+                rows.setdefault(value, []).append(row)
+        return rows
+
+    def __len__(self):
+        return len(self.paths)
+
+    def find(self, predicates):
+        """Return the paths matching all predicates in index order"""
+        if not predicates:
+            return list(self.paths)
+        candidates = [self.candidates(predicate) for predicate in predicates]
+        smallest = min(range(len(predicates)),
+                       key=lambda i: (candidates[i] is None,
+                                      len(candidates[i] or ())))
+        rows = candidates[smallest]
+        if rows is None:
+            rows = self.matching(range(len(self.paths)), predicates[smallest])
+        for i, predicate in enumerate(predicates):
+            if i != smallest:
+                rows = self.matching(rows, predicate)
+        return [self.paths[row] for row in sorted(rows)]
+
+    def candidates(self, predicate):
+        """Rows that may match predicate, None if every row has to be checked
+        """
+        field, op, value = predicate
+        if op == '~':
+            if field in NUMERIC:
+                return None
+            return [row
+                    for text, rows in self.values[field].items()
+                    if value in text
+                    for row in rows]
+        if field in NUMERIC:
+            values, rows = self.numbers[field]
+            low, high = value
+            start = 0 if low is None else bisect_left(values, low)
+            end = len(values) if high is None else bisect_right(values, high)
+            return rows[start:end]
+        return self.values[field].get(value, [])
+
+    def matching(self, rows, predicate):
+        field, op, value = predicate
+        column = self.columns[field]
+        if op == '~' and field in NUMERIC:
+            return [row for row in rows if column[row] is not None and
+                    value in format_number(column[row])]
+        if op == '~':
+            return [row for row in rows
+                    if column[row] is not None and value in column[row]]
+        if field in NUMERIC:
+            low = float('-inf') if value[0] is None else value[0]
+            high = float('inf') if value[1] is None else value[1]
+            return [row for row in rows
+                    if column[row] is not None and low <= column[row] <= high]
+        return [row for row in rows if column[row] == value]
+
+
+class Lowercase(object):
+    """Lowercase values and share the result between equal values"""
+
+    def __init__(self):
+        self.seen = {}
+
+    def __call__(self, value):
+        if value is None:
+            return None
+        try:
+            return self.seen[value]
+        except KeyError:
+            lowered = self.seen[value] = str(value).lower()
+            return lowered
+
+
+def number(value):
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        # yaml imports may also contain dates
+        match = NUMBER.match(str(value))
+    if match is None:
+        return None
+    return float(match.group(1))
+
+
+def format_number(value):
+    return str(int(value)) if value.is_integer() else str(value)
+
+
+def parse_query(terms):
+    """Parse terms like "bpm:120..128", "key:8A" or "genre~house"
+
+    Returns (field, op, value) predicates. Values are compared case
+    insensitively, ranges of numeric fields may be open on either side.
+    """
+    return [parse_predicate(term) for term in terms]
+
+
+def parse_predicate(term):
+    match = PREDICATE.match(term)
+    if match is None:
+        raise QueryError('Invalid query {}, expected field:value, '
+                         'field:low..high or field~text'.format(term))
+    field, op, value = match.groups()
+    if field not in FIELDS:
+        raise QueryError('Unknown field {}, valid fields are {}'
+                         .format(field, ', '.join(FIELDS)))
+    value = value.lower()
+    if op == '~' or field not in NUMERIC:
+        return field, op, value
+    low, dots, high = value.partition('..')
+    if not dots:
+        high = low
+    try:
+        bounds = tuple(float(bound) if bound else None
+                       for bound in (low, high))
+    except ValueError:
+        raise QueryError('Invalid range {} for {}'.format(value, field))
+    return field, op, bounds
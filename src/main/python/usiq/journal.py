@@ -0,0 +1,101 @@
+import os
+import json
+from collections import OrderedDict
+from contextlib import contextmanager
+from logbook import warning
+
+
+SYNC_INTERVAL = 1000
+
+
+class Journal(object):
+    """Append-only log of planned and completed operations (JSON lines)
+
+    Entries are flushed to disk every sync_interval records, so after a crash
+    the last few completed operations may be missing from the journal and
+    are repeated on resume.
+    """
+
+    def __init__(self, fname, sync_interval=SYNC_INTERVAL):
+        self.f = open(os.path.expanduser(fname), 'ab+')
+        self.sync_interval = sync_interval
+        self.pending = 0
+        if self.f.tell():
+            # Terminate a line that was cut off by an interrupted run
+            self.f.seek(-1, os.SEEK_END)
+            if self.f.read(1) != b'\n':
+                self.f.write(b'\n')
+
+    def planned(self, op, path, **details):
+        self.record(op, 'planned', path, details)
+
+    def done(self, op, path, **details):
+        self.record(op, 'done', path, details)
+
+    def record(self, op, state, path, details):
+        entry = dict(details, op=op, state=state, path=os.path.abspath(path))
+        self.f.write(json.dumps(entry).encode('utf-8') + b'\n')
+        self.pending += 1
+        if self.pending >= self.sync_interval:
+            self.sync()
+
+    def sync(self):
+        self.f.flush()
+        os.fsync(self.f.fileno())
+        self.pending = 0
+
+    def close(self):
+        self.sync()
+        self.f.close()
+
+
+class Progress(object):
+    """Operations recorded in a journal, keyed by operation and path"""
+
+    def __init__(self, entries):
+        self.planned = OrderedDict()
+        self.done = OrderedDict()
+        for entry in entries:
+            key = (entry['op'], entry['path'])
+            if entry['state'] == 'planned':
+                self.planned[key] = entry
+            else:
+                self.done[key] = entry
+
+    def is_done(self, op, path):
+        return (op, os.path.abspath(path)) in self.done
+
+    def pending(self, op):
+        return [entry for key, entry in self.planned.items()
+                if key[0] == op and key not in self.done]
+
+    def completed(self, op):
+        return [entry for key, entry in self.done.items() if key[0] == op]
+
+
+def read_journal(fname):
+    with open(os.path.expanduser(fname), 'rb') as f:
+        return Progress(parse_entries(f, fname))
+
+
+def parse_entries(lines, fname):
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line.decode('utf-8'))
+        except ValueError:
+            warning('Skipping incomplete entry in {}, line {}'
+                    .format(fname, number))
+
+
+@contextmanager
+def open_journal(fname):
+    if not fname:
+        yield None
+        return
+    journal = Journal(fname)
+    try:
+        yield journal
+    finally:
+        journal.close()
@@ -0,0 +1,98 @@
+import os
+from collections import deque
+from itertools import chain, islice
+
+from . import timing
+
+
+def num_jobs(value):
+    jobs = int(value)
+    if jobs < 1:
+        return os.cpu_count() or 1
+    return jobs
+
+
+def imap(func, items, jobs=1, chunksize=1, window=None):
+    """Apply func to every item and yield (item, result, error) in order
+
+    With more than one job the items are sent to a process pool in chunks
+    of chunksize. At most window chunks are queued at any time, which bounds
+    both memory and the number of files that are open concurrently. A
+    failing item yields its error message instead of stopping the run.
+    No more workers are started than there are chunks, and runs that fit
+    into a single chunk do not start a pool at all.
+    """
+    if jobs > 1:
+        items = iter(items)
+        head = list(islice(items, jobs * chunksize))
+        jobs = min(jobs, -(-len(head) // chunksize))
+        items = chain(head, items)
+
+    if jobs <= 1:
+        for item in items:
+            yield (item,) + apply(func, item)
+        return
+
+    if window is None:
+        window = 2 * jobs
+
+    # Single process runs do not pay for importing multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+
+    with ProcessPoolExecutor(jobs) as executor:
+        pending = deque()
+        for chunk in chunked(items, chunksize):
+            future = executor.submit(apply_chunk, func, chunk,
+                                     timing.enabled())
+            pending.append((chunk, future))
+            if len(pending) >= window:
+                yield from collect(*pending.popleft())
+        while pending:
+            yield from collect(*pending.popleft())
+
+
+def prefetch(func, items, depth):
+    """Yield (item, future) with func(item) running depth items ahead
+
+    func runs in a pool of depth threads, which suits I/O bound work such
+    as reading from network file systems. Errors are raised by the future.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    with ThreadPoolExecutor(depth) as executor:
+        pending = deque()
+        for item in items:
+            pending.append((item, executor.submit(func, item)))
+            if len(pending) > depth:
+                yield pending.popleft()
+        while pending:
+            yield pending.popleft()
+
+
+def apply(func, item):
+    try:
+        return func(item), None
+    except Exception as err:
+        return None, '{}: {}'.format(type(err).__name__, err)
+
+
+def apply_chunk(func, chunk, profiling=False):
+    # Timings taken in a worker are sent back along with the results
+    if profiling:
+        timing.record()
+    return [apply(func, item) for item in chunk], timing.drain()
+
+
+def collect(chunk, future):
+    results, samples = future.result()
+    timing.merge(samples)
+    for item, (result, error) in zip(chunk, results):
+        yield item, result, error
+
+
+def chunked(items, size):
+    items = iter(items)
+    chunk = list(islice(items, size))
+    while chunk:
+        yield chunk
+        chunk = list(islice(items, size))
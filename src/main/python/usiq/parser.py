@@ -1,16 +1,45 @@
 import re
 import os
+from functools import lru_cache
 
+from . import timing
 from .tagger import FIELDS
 
 
+PATTERN_CACHE_SIZE = 64
+
+
+class CompiledPattern(object):
+
+    def __init__(self, pattern):
+        self.pattern = pattern
+        self.regexp = re.compile(construct_regexp(pattern))
+
+    def match(self, fname):
+        """Return the tags parsed from fname, None if it does not match"""
+        started = timing.start()
+        basename, _ = os.path.splitext(os.path.abspath(fname))
+        found = self.regexp.search(basename)
+        if found is None:
+            timing.stop('parse_filename', started, fname)
+            return None
+        parsed = found.groupdict()
+        for key in parsed:
+            parsed[key] = parsed[key].replace('_', ' ')
+        timing.stop('parse_filename', started, fname)
+        return parsed
+
+    def match_many(self, fnames):
+        return [self.match(fname) for fname in fnames]
+
+
+@lru_cache(maxsize=PATTERN_CACHE_SIZE)
+def compile_pattern(pattern):
+    return CompiledPattern(pattern)
+
+
 def parse_filename(fname, pattern):
-    basename, _ = os.path.splitext(os.path.abspath(fname))
-    regexp = construct_regexp(pattern)
-    parsed = re.search(regexp, basename).groupdict()
-    for key in parsed:
-        parsed[key] = parsed[key].replace('_', ' ')
-    return parsed
+    return compile_pattern(pattern).match(fname)
 
 
 def construct_regexp(pattern):
@@ -26,11 +55,11 @@ def construct_regexp(pattern):
     for field in number_fields:
         if field in fields:
             regexp = re.sub(r'<{}>'.format(field),
-                            r'(?P<{}>\d+)'.format(field),
+                            r'(?P<{}>\\d+)'.format(field),
                             regexp)
 
     if 'key' in fields:
-        regexp = re.sub(r'<key>', r'(?P<key>\d+[ABab])', regexp)
+        regexp = re.sub(r'<key>', r'(?P<key>\\d+[ABab])', regexp)
     return regexp + '$'
 
 
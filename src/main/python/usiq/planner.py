@@ -0,0 +1,94 @@
+import os
+import json
+from logbook import info, warning
+
+from . import fileops, timing
+
+
+class RenamePlan(object):
+
+    def __init__(self, moves=None, copy=False):
+        self.moves = list(moves or [])
+        self.copy = copy
+
+    def add(self, source, target):
+        self.moves.append((source, target))
+
+    def dump(self, f):
+        moves = [(os.path.abspath(source), os.path.abspath(target))
+                 for source, target in self.moves]
+        json.dump({'copy': self.copy, 'moves': moves}, f, indent=1)
+
+    @classmethod
+    def load(cls, f):
+        data = json.load(f)
+        return cls(((source, target) for source, target in data['moves']),
+                   copy=data.get('copy', False))
+
+
+class DirectoryCache(object):
+    """Answer existence checks from one listing per directory"""
+
+    def __init__(self):
+        self.listings = {}
+
+    def exists(self, fname):
+        directory, name = os.path.split(fname)
+        if directory not in self.listings:
+            self.listings[directory] = self.list(directory)
+        return name in self.listings[directory]
+
+    def list(self, directory):
+        try:
+            return set(os.listdir(directory or os.curdir))
+        except (FileNotFoundError, NotADirectoryError):
+            return set()
+
+
+def plan_renames(entries, template, copy=False):
+    plan = RenamePlan(copy=copy)
+    directories = DirectoryCache()
+    sources = {}
+    for fname, tags in entries:
+        _, extension = os.path.splitext(fname)
+        target = template.render(tags) + extension
+        if target in sources:
+            warning('Not moving {} -> {}, {} is moved there already!'
+                    .format(fname, target, sources[target]))
+            continue
+        if directories.exists(target):
+            warning('Not moving {} -> {}, target file exists!'
+                    .format(fname, target))
+            continue
+        sources[target] = fname
+        plan.add(fname, target)
+    return plan
+
+
+def apply_plan(plan, dry=False, verify=False, journal=None):
+    directories = DirectoryCache()
+    created = set()
+    if plan.copy:
+        op, verb, transfer = 'copy', 'Copying', fileops.copy_file
+    else:
+        op, verb, transfer = 'rename', 'Moving', fileops.move_file
+    for source, target in plan.moves:
+        # Files may appear after the plan was made or the directory was
+        # listed, so every target is checked again right before the move
+        if (verify and directories.exists(target) or
+                not dry and os.path.lexists(target)):
+            warning('Not moving {} -> {}, target file exists!'
+                    .format(source, target))
+            continue
+        info('{} {} -> {}'.format(verb, source, target))
+        if dry:
+            continue
+        directory = os.path.dirname(target)
+        if directory and directory not in created:
+            os.makedirs(directory, exist_ok=True)
+            created.add(directory)
+        started = timing.start()
+        transfer(source, target)
+        timing.stop(op, started, source)
+        if journal is not None:
+            journal.done(op, source, target=os.path.abspath(target))
@@ -1,30 +1,120 @@
 import os
+import re
 import string
 import unicodedata
-from . import parser
+from functools import lru_cache
 
+from . import timing
+from .tagger import FIELDS
 
-def create_filename(tags, pattern):
-    fields = parser.get_fields(pattern)
-    for field, formatter in fields.items():
-        if formatter:
-            pattern = pattern.replace(
-                '<{}.{}>'.format(field, formatter),
-                format_filename(getattr(tags[field], formatter)()))
+
+TEMPLATE_CACHE_SIZE = 64
+# Artists, albums and genres repeat from file to file
+FILENAME_CACHE_SIZE = 4096
+
+
+class Charset(object):
+    """Characters that may appear in filenames
+
+    Characters in replace are substituted with translate. Unless unicode is
+    set, accents are removed and all other non-ASCII characters are dropped.
+    """
+
+    def __init__(self, replace, unicode=True, quotes=True):
+        self.table = str.maketrans(replace)
+        self.unicode = unicode
+        self.quotes = quotes
+
+    def format(self, filename):
+        if not self.unicode:
+            filename = remove_accents(filename)
+        if self.quotes:
+            filename = format_quotes(filename)
+        return filename.translate(self.table)
+
+
+def replace_invalid(valid, substitutes):
+    replace = {chr(c): '_' for c in range(128) if chr(c) not in valid}
+    replace.update(substitutes)
+    return replace
+
+
+VALID_ASCII = '-_.() ' + string.ascii_letters + string.digits
+CONTROL = ''.join(chr(c) for c in range(32)) + '\x7f'
+CHARSETS = {
+    # Letters, digits and a few safe punctuation characters only
+    'ascii': Charset(replace_invalid(VALID_ASCII, {'[': '(', ']': ')'}),
+                     unicode=False),
+    # Everything except the characters FAT32 and Windows reserve
+    'fat32': Charset({c: '_' for c in CONTROL + '\\/:*?<>|'}),
+    # Everything except path separators and control characters
+    'unicode': Charset({c: '_' for c in CONTROL + '/'}, quotes=False),
+}
+DEFAULT_CHARSET = 'ascii'
+
+
+class Template(object):
+
+    def __init__(self, pattern, charset=DEFAULT_CHARSET):
+        self.pattern = pattern
+        self.charset = charset
+        self.segments = compile_segments(pattern)
+
+    def render(self, tags):
+        started = timing.start()
+        parts = []
+        for literal, field, formatter in self.segments:
+            if field is None:
+                parts.append(literal)
+            elif formatter is None:
+                parts.append(format_filename(tags[field], self.charset))
+            else:
+                parts.append(format_filename(formatter(tags[field]),
+                                             self.charset))
+        timing.stop('format_filename', started)
+        return os.path.expanduser(''.join(parts))
+
+
+def compile_segments(pattern):
+    segments = []
+    for i, part in enumerate(re.split(r'<(.*?)>', pattern)):
+        if i % 2 == 0:
+            literal = part
         else:
-            pattern = pattern.replace(
-                '<{}>'.format(field),
-                format_filename(tags[field]))
-    return os.path.expanduser(pattern)
-
-
-def format_filename(filename):
-    filename = remove_accents(filename)
-    filename = filename.replace('[', '(').replace(']', ')')
-    filename = format_quotes(filename)
-    valid_chars = '-_.() {}{}'.format(string.ascii_letters, string.digits)
-    filename = ''.join(c if c in valid_chars else '_' for c in filename)
-    return filename
+            field, formatter = split_field(part)
+            if field is not None:
+                segments.append((None, field, formatter))
+                continue
+            literal = '<{}>'.format(part)
+        if not literal:
+            continue
+        if segments and segments[-1][1] is None:
+            literal = segments.pop()[0] + literal
+        segments.append((literal, None, None))
+    return segments
+
+
+def split_field(spec):
+    parts = spec.split('.')
+    if parts[0] not in FIELDS or len(parts) > 2:
+        return None, None
+    if len(parts) == 1:
+        return parts[0], None
+    return parts[0], getattr(str, parts[1])
+
+
+@lru_cache(maxsize=TEMPLATE_CACHE_SIZE)
+def compile_template(pattern, charset=DEFAULT_CHARSET):
+    return Template(pattern, charset)
+
+
+def create_filename(tags, pattern, charset=DEFAULT_CHARSET):
+    return compile_template(pattern, charset).render(tags)
+
+
+@lru_cache(maxsize=FILENAME_CACHE_SIZE)
+def format_filename(filename, charset=DEFAULT_CHARSET):
+    return CHARSETS[charset].format(filename)
 
 
 def remove_accents(filename):
@@ -0,0 +1,131 @@
+import os
+import json
+import socket
+import socketserver
+from contextlib import redirect_stdout
+from docopt import docopt
+from logbook import info, warning, StreamHandler
+
+from usiq import cli, client, tagfile
+
+
+class RequestStream(object):
+    """Text stream that forwards everything written to it to the client"""
+
+    def __init__(self, wfile):
+        self.wfile = wfile
+
+    def write(self, text):
+        if text:
+            client.send(self.wfile, {'output': text})
+        return len(text)
+
+    def flush(self):
+        self.wfile.flush()
+
+
+class Server(socketserver.UnixStreamServer):
+    """Run usiq commands one at a time in a warm process
+
+    Configuration files are parsed once and kept until they are modified.
+    Imported modules and compiled patterns stay loaded between requests.
+    """
+
+    def __init__(self, path, doc):
+        self.doc = doc
+        self.configs = {}
+        socketserver.UnixStreamServer.__init__(self, path, RequestHandler)
+
+    def config(self, fname):
+        try:
+            mtime = os.stat(fname).st_mtime_ns
+        except OSError:
+            mtime = None
+        if fname not in self.configs or self.configs[fname][0] != mtime:
+            self.configs[fname] = (mtime, cli.load_config(fname))
+        return self.configs[fname][1]
+
+    def run(self, request, stream):
+        cwd = os.getcwd()
+        try:
+            os.chdir(request['cwd'])
+            with redirect_stdout(stream):
+                args = docopt(self.doc, argv=request['argv'])
+                args = cli.with_config(args, self.config(args['--config']))
+                if args['serve'] or args.get('watch'):
+                    raise cli.UsiqError('serve and watch cannot run in the '
+                                        'server')
+                check_streams(args)
+                level = 'DEBUG' if args['--verbose'] else 'INFO'
+                with StreamHandler(stream, level=level,
+                                   bubble=False).applicationbound():
+                    cli.run(args)
+            return 0
+        except SystemExit as err:
+            # docopt exits with the usage message on invalid arguments
+            if err.code is None or err.code == 0:
+                return 0
+            stream.write('{}\n'.format(err.code))
+            return 1
+        except Exception as err:
+            warning('Request {} failed: {}'.format(request['argv'], err))
+            stream.write('{}: {}\n'.format(type(err).__name__, err))
+            return 1
+        finally:
+            os.chdir(cwd)
+
+
+def check_streams(args):
+    """Refuse "-" arguments that need the client's stdin or binary stdout
+
+    Only text written to stdout is forwarded to the client.
+    """
+    for option in ('--import', '--files-from', '<PLAN>'):
+        if args.get(option) == '-':
+            raise cli.UsiqError('{} - would read the stdin of the server, '
+                                'pass a file instead'.format(option))
+    if args.get('--output') == '-':
+        fmt = tagfile.guess_format('-', args.get('--format'))
+        if tagfile.is_binary(fmt) or args.get('--compress'):
+            raise cli.UsiqError('Binary output cannot be written to stdout '
+                                'by the server, pass a file instead')
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        request = json.loads(self.rfile.readline().decode('utf-8'))
+        status = self.server.run(request, RequestStream(self.wfile))
+        client.send(self.wfile, {'status': status})
+
+
+def serve(path, doc):
+    path = path or client.default_socket()
+    if is_serving(path):
+        raise cli.UsiqError('A usiq server is already running on {}'
+                            .format(path))
+    if os.path.exists(path):
+        os.unlink(path)
+    umask = os.umask(0o077)
+    try:
+        server = Server(path, doc)
+    finally:
+        os.umask(umask)
+    info('Serving on {}'.format(path))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.unlink(path)
+
+
+def is_serving(path):
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    with connection:
+        try:
+            connection.connect(path)
+        except OSError:
+            return False
+    return True
@@ -0,0 +1,154 @@
+import os
+import json
+import yaml
+from yaml.composer import Composer
+from yaml.events import (DocumentStartEvent, MappingStartEvent,
+                         MappingEndEvent)
+
+try:
+    from yaml import CSafeDumper as SafeDumper, CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeDumper, SafeLoader
+
+from . import columnar
+
+
+class StreamingLoader(SafeLoader, Composer):
+    # libyaml's loader only composes whole documents, the python composer
+    # on top of its events lets us construct one entry at a time
+
+    def __init__(self, stream):
+        SafeLoader.__init__(self, stream)
+        Composer.__init__(self)
+
+
+class UnknownFormatError(Exception):
+    pass
+
+
+class YamlWriter(object):
+
+    def __init__(self, f):
+        self.f = f
+
+    def write(self, path, tags):
+        # Single-key mappings in block style concatenate to one mapping
+        yaml.dump({path: tags}, self.f,
+                  Dumper=SafeDumper,
+                  default_flow_style=False)
+
+    def close(self):
+        self.f.flush()
+
+
+class JsonLinesWriter(object):
+
+    def __init__(self, f):
+        self.f = f
+
+    def write(self, path, tags):
+        entry = {'path': path}
+        entry.update(tags)
+        self.f.write(json.dumps(entry) + '\n')
+
+    def close(self):
+        self.f.flush()
+
+
+class TagLookup(object):
+    """Look up imported tags by path while reading the entries lazily
+
+    Entries that are passed over are kept until they are requested, so
+    files can be looked up in any order. When files are requested in the
+    order of the tag file (as for files exported by usiq), only a single
+    entry is held in memory.
+    """
+
+    def __init__(self, entries):
+        self.entries = iter(entries)
+        self.pending = {}
+
+    def pop(self, path):
+        if path in self.pending:
+            return self.pending.pop(path) or {}
+        for entry_path, tags in self.entries:
+            if entry_path == path:
+                return tags or {}
+            self.pending[entry_path] = tags
+        return {}
+
+
+def read_yaml(f):
+    loader = StreamingLoader(f)
+    try:
+        loader.get_event()
+        if not loader.check_event(DocumentStartEvent):
+            return
+        loader.get_event()
+        if not loader.check_event(MappingStartEvent):
+            return
+        loader.get_event()
+        while not loader.check_event(MappingEndEvent):
+            path = loader.construct_object(loader.compose_node(None, None))
+            tags = loader.construct_object(loader.compose_node(None, None),
+                                           deep=True)
+            loader.constructed_objects = {}
+            yield path, tags
+    finally:
+        loader.dispose()
+
+
+def read_jsonl(f):
+    for line in f:
+        if line.strip():
+            tags = json.loads(line)
+            yield tags.pop('path'), tags
+
+
+WRITERS = {'yaml': YamlWriter,
+           'jsonl': JsonLinesWriter,
+           'columnar': columnar.ColumnarWriter}
+READERS = {'yaml': read_yaml,
+           'jsonl': read_jsonl,
+           'columnar': columnar.read_entries}
+BINARY_FORMATS = ('columnar',)
+EXTENSIONS = {'.yaml': 'yaml',
+              '.yml': 'yaml',
+              '.jsonl': 'jsonl',
+              '.usiq': 'columnar'}
+COMPRESSION_EXTENSIONS = {'.gz': 'gzip',
+                          '.zst': 'zstd'}
+
+
+def guess_format(fname, fmt=None):
+    if fmt:
+        if fmt not in WRITERS:
+            raise UnknownFormatError('Unknown tag file format {}'.format(fmt))
+        return fmt
+    basename, extension = os.path.splitext(fname)
+    if extension.lower() in COMPRESSION_EXTENSIONS:
+        _, extension = os.path.splitext(basename)
+    return EXTENSIONS.get(extension.lower(), 'yaml')
+
+
+def guess_compression(fname, compression=None):
+    if compression:
+        return compression
+    _, extension = os.path.splitext(fname)
+    return COMPRESSION_EXTENSIONS.get(extension.lower())
+
+
+def is_binary(fmt):
+    return fmt in BINARY_FORMATS
+
+
+def get_writer(f, fmt, compression=None):
+    if compression is None:
+        return WRITERS[fmt](f)
+    if not is_binary(fmt):
+        raise UnknownFormatError('Only the columnar format can be compressed')
+    return WRITERS[fmt](f, compression=compression)
+
+
+def read_entries(f, fmt):
+    return READERS[fmt](f)
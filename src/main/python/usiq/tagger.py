@@ -1,7 +1,9 @@
 import os
-import mutagen
-import mutagen.id3
-from logbook import warn
+import io
+import struct
+from logbook import warn, warning, debug
+
+from . import timing
 
 
 FIELDS = ('title',
@@ -19,13 +21,93 @@ class NoTaggerError(Exception):
     pass
 
 
+class ReadOnlyTaggerError(Exception):
+    pass
+
+
+class PaddingPolicy(object):
+    """Keep the existing padding and reserve some when a file is rewritten
+
+    mutagen calls the policy with the padding that is left after the new
+    tags are written. As long as that is not negative, the tags are written
+    in place. Otherwise the whole file is rewritten with reserve bytes of
+    padding (or mutagen's default if reserve is None).
+    """
+
+    def __init__(self, reserve=None):
+        self.reserve = reserve
+        self.rewritten = False
+
+    def __call__(self, info):
+        if info.padding >= 0:
+            return info.padding
+        self.rewritten = True
+        if self.reserve is None:
+            return info.get_default_padding()
+        return self.reserve
+
+
 class Tagger(object):
 
-    def __init__(self, fname):
-        self.tags = mutagen.File(fname)
+    supported_extensions = ()
+    # (offset, bytes) pairs identifying the file format
+    magic = ()
+
+    def __init__(self, fname, bounded=False, region=None):
+        self.fname = fname
+        self.bounded = False
+        self.bytes_read = None
+        self.rewritten = None
+        started = timing.start()
+        if region is None and bounded:
+            region = self.read_region(fname)
+        if region is None:
+            self.tags = self.load(fname)
+        else:
+            self.tags = self.parse_region(region)
+            self.bounded = True
+        timing.stop('read', started, fname)
+
+    def load(self, fname):
+        # mutagen is imported on first use, and only the modules for this
+        # format are loaded
+        import mutagen
+        file_types = self.file_types()
+        if not file_types:
+            return mutagen.File(fname)
+        return mutagen.File(fname, options=file_types)
+
+    def file_types(self):
+        return None
+
+    def read_region(self, fname):
+        region, self.bytes_read = self.fetch_region(fname)
+        return region
+
+    @classmethod
+    def fetch_region(cls, fname):
+        with open(fname, 'rb') as f:
+            reader = RegionReader(f)
+            region = cls.read_tag_region(reader)
+        debug('Read {} bytes of tags from {}'.format(reader.bytes_read, fname))
+        return region, reader.bytes_read
+
+    @classmethod
+    def read_tag_region(cls, reader):
+        return None
+
+    def parse_region(self, region):
+        raise NotImplementedError
 
-    def save(self):
-        self.tags.save()
+    def save(self, padding=None):
+        if self.bounded:
+            raise ReadOnlyTaggerError('Tags of {} were only partially read'
+                                      .format(self.fname))
+        policy = PaddingPolicy(padding)
+        started = timing.start()
+        self.tags.save(padding=policy)
+        timing.stop('save', started, self.fname)
+        self.rewritten = policy.rewritten
 
     def __getitem__(self, key):
         raise NotImplementedError
@@ -36,49 +118,108 @@ class Tagger(object):
     def __str__(self):
         return str(self.todict())
 
-    def todict(self):
-        return {key: self[key] for key in FIELDS}
+    def get_many(self, fields):
+        return {key: self[key] for key in fields}
+
+    def todict(self, fields=FIELDS):
+        return self.get_many(fields)
 
 
 class Mp3Tagger(Tagger):
 
     supported_extensions = ('.mp3',)
+    magic = ((0, b'ID3'),
+             (0, b'\xff\xfb'),
+             (0, b'\xff\xfa'),
+             (0, b'\xff\xf3'),
+             (0, b'\xff\xf2'),
+             (0, b'\xff\xe3'),
+             (0, b'\xff\xe2'))
+
+    frames = {'title': 'TIT2',
+              'artist': 'TPE1',
+              'album': 'TALB',
+              'genre': 'TCON',
+              'albumartist': 'TPE2',
+              'bpm': 'TBPM',
+              'tracknumber': 'TRCK',
+              'year': 'TDRC',
+              'key': 'TKEY',
+              }
+    # ID3 before 2.4 stores the year in a separate frame
+    frames_v23 = dict(frames, year='TYER')
+    file_frames = None
 
     def __getitem__(self, key):
         try:
-            return self.tags[self.translate_key(key)].text[0]
+            # str() turns timestamps (TDRC) into plain strings
+            return str(self.tags[self.translate_key(key)].text[0])
         except KeyError:
             # This should not happen for correcly formatted tags, but it seems
             # to happen for some files
             return None
 
     def __setitem__(self, key, value):
+        import mutagen.id3
         tagname = self.translate_key(key)
         self.tags[tagname] = getattr(mutagen.id3, tagname)(text=[value])
 
+    def file_types(self):
+        import mutagen.mp3
+        return [mutagen.mp3.MP3]
+
+    @classmethod
+    def read_tag_region(cls, reader):
+        header = reader.read(10)
+        if len(header) < 10 or not header.startswith(b'ID3'):
+            return None
+        size = 0
+        for byte in header[6:10]:
+            size = (size << 7) | (byte & 0x7f)
+        if header[5] & 0x10:
+            size += 10
+        return header + reader.read(size)
+
+    def parse_region(self, region):
+        import mutagen.id3
+        return mutagen.id3.ID3(io.BytesIO(region), load_v1=False)
+
+    @property
+    def id3(self):
+        import mutagen.id3
+        if isinstance(self.tags, mutagen.id3.ID3):
+            return self.tags
+        return self.tags.tags
+
+    def get_many(self, fields):
+        frames = self.frame_table()
+        result = {}
+        for key in fields:
+            try:
+                result[key] = str(self.tags[frames[key]].text[0])
+            except KeyError:
+                result[key] = None
+        return result
+
     def translate_key(self, key):
-        if self.tags.tags is None:
-            year_key = 'TDRC'
-        elif self.tags.tags.version == (2, 4, 0):
-            year_key = 'TDRC'
-        else:
-            year_key = 'TYER'
-        d = {'title': 'TIT2',
-             'artist': 'TPE1',
-             'album': 'TALB',
-             'genre': 'TCON',
-             'albumartist': 'TPE2',
-             'bpm': 'TBPM',
-             'tracknumber': 'TRCK',
-             'year': year_key,
-             'key': 'TKEY',
-             }
-        return d[key]
+        return self.frame_table()[key]
+
+    def frame_table(self):
+        # The version is resolved once per file
+        if self.file_frames is None:
+            if self.id3 is None or self.id3.version == (2, 4, 0):
+                self.file_frames = self.frames
+            else:
+                self.file_frames = self.frames_v23
+        return self.file_frames
 
 
 class FlacTagger(Tagger):
 
     supported_extensions = ('.flac', '.ogg')
+    magic = ((0, b'fLaC'), (0, b'OggS'))
+    # STREAMINFO and VORBIS_COMMENT, pictures and padding are skipped
+    region_blocks = (0, 4)
 
     def __getitem__(self, key):
         if key in self.tags:
@@ -89,10 +230,59 @@ class FlacTagger(Tagger):
     def __setitem__(self, key, value):
         self.tags[key] = [value]
 
+    @classmethod
+    def read_tag_region(cls, reader):
+        if reader.read(4) != b'fLaC':
+            return None
+        blocks = []
+        last = False
+        while not last:
+            header = reader.read(4)
+            if len(header) < 4:
+                return None
+            last = bool(header[0] & 0x80)
+            block_type = header[0] & 0x7f
+            length = struct.unpack('>I', b'\x00' + header[1:])[0]
+            if block_type in cls.region_blocks:
+                blocks.append([block_type, reader.read(length)])
+            else:
+                reader.skip(length)
+        if not blocks:
+            return None
+        blocks[-1][0] |= 0x80
+        return b'fLaC' + b''.join(
+            bytes([block_type]) + struct.pack('>I', len(data))[1:] + data
+            for block_type, data in blocks)
+
+    def file_types(self):
+        import mutagen.flac
+        import mutagen.oggflac
+        import mutagen.oggopus
+        import mutagen.oggvorbis
+        return [mutagen.flac.FLAC,
+                mutagen.oggvorbis.OggVorbis,
+                mutagen.oggopus.OggOpus,
+                mutagen.oggflac.OggFLAC]
+
+    def parse_region(self, region):
+        import mutagen.flac
+        return mutagen.flac.FLAC(io.BytesIO(region))
+
 
 class M4aTagger(Tagger):
 
     supported_extensions = ('.m4a',)
+    magic = ((4, b'ftyp'),)
+    region_atoms = (b'mvhd', b'udta')
+    atoms = {'title': '\xa9nam',
+             'artist': '\xa9ART',
+             'album': '\xa9alb',
+             'genre': '\xa9gen',
+             'albumartist': 'aART',
+             'bpm': 'tmpo',
+             'year': '\xa9day',
+             }
+    file_key_atom = None
 
     def __getitem__(self, key):
         if key == 'tracknumber':
@@ -112,44 +302,197 @@ class M4aTagger(Tagger):
         else:
             self.tags[self.translate_key(key)] = [value]
 
+    @classmethod
+    def read_tag_region(cls, reader):
+        for name, data_size in iter_atoms(reader):
+            if name != b'moov':
+                reader.skip(data_size)
+                continue
+            children = []
+            for child, child_size in iter_atoms(reader, data_size):
+                if child in cls.region_atoms:
+                    children.append(make_atom(child, reader.read(child_size)))
+                else:
+                    reader.skip(child_size)
+            return make_atom(b'moov', b''.join(children))
+        return None
+
+    def file_types(self):
+        import mutagen.mp4
+        return [mutagen.mp4.MP4]
+
+    def parse_region(self, region):
+        import mutagen.mp4
+        return mutagen.mp4.MP4(io.BytesIO(region))
+
     def translate_key(self, key):
-        self.d = {'title': '\xa9nam',
-                  'artist': '\xa9ART',
-                  'album': '\xa9alb',
-                  'genre': '\xa9gen',
-                  'albumartist': 'aART',
-                  'bpm': 'tmpo',
-                  'year': '\xa9day',
-                  }
-        if key == 'key' and key not in self.d:
+        if key == 'key':
+            return self.key_atom()
+        return self.atoms[key]
+
+    def key_atom(self):
+        # Keys are stored in freeform atoms, so they are searched once
+        if self.file_key_atom is None:
             candidates = [key for key in self.tags if 'initialkey' in key]
-            self.d['key'] = candidates[0]
-        return self.d[key]
-
-
-def get_tagger(fname):
-    basename, extension = os.path.splitext(fname)
-    tagger = [tagr
-              for tagr in Tagger.__subclasses__()
-              if extension.lower() in tagr.supported_extensions]
-    if len(tagger):
-        return tagger[0](fname)
-    else:
+            self.file_key_atom = candidates[0]
+        return self.file_key_atom
+
+
+class RegionReader(object):
+
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.bytes_read = 0
+
+    def read(self, size):
+        data = self.fileobj.read(size)
+        self.bytes_read += len(data)
+        return data
+
+    def skip(self, size):
+        self.fileobj.seek(size, os.SEEK_CUR)
+
+    def remaining(self):
+        return os.fstat(self.fileobj.fileno()).st_size - self.fileobj.tell()
+
+
+def iter_atoms(reader, size=None):
+    remaining = size
+    while remaining is None or remaining >= 8:
+        header = reader.read(8)
+        if len(header) < 8:
+            return
+        atom_size, name = struct.unpack('>I4s', header)
+        header_size = 8
+        if atom_size == 1:
+            atom_size = struct.unpack('>Q', reader.read(8))[0]
+            header_size = 16
+        elif atom_size == 0:
+            # The atom extends to the end of its container
+            if remaining is None:
+                atom_size = header_size + reader.remaining()
+            else:
+                atom_size = remaining
+        if atom_size < header_size:
+            return
+        if remaining is not None:
+            remaining -= atom_size
+        yield name, atom_size - header_size
+
+
+def make_atom(name, data):
+    return struct.pack('>I', 8 + len(data)) + name + data
+
+
+TAGGERS = (Mp3Tagger, FlacTagger, M4aTagger)
+EXTENSIONS = {extension: tagr
+              for tagr in TAGGERS
+              for extension in tagr.supported_extensions}
+SNIFF_SIZE = 12
+
+
+def detect(fname, sniff=False):
+    if sniff:
+        tagr = sniff_tagger(fname)
+        if tagr is None:
+            raise NoTaggerError('Could not recognize content of {}'
+                                .format(fname))
+        return tagr
+
+    _, extension = os.path.splitext(fname)
+    tagr = EXTENSIONS.get(extension.lower())
+    if tagr is None:
         raise NoTaggerError('Could not find tagger for extension {}'
                             .format(extension))
+    return tagr
+
+
+def sniff_tagger(fname):
+    with open(fname, 'rb') as f:
+        head = f.read(SNIFF_SIZE)
+    for tagr in TAGGERS:
+        for offset, magic in tagr.magic:
+            if head[offset:offset + len(magic)] == magic:
+                return tagr
+    return None
+
+
+def recognize(fnames, sniff=False):
+    """Yield (fname, tagger class) for the files a tagger is found for
+
+    The class can be passed on to get_tagger, so every file is sniffed once.
+    """
+    for fname in fnames:
+        try:
+            tagr = detect(fname, sniff)
+        except (NoTaggerError, OSError) as err:
+            warning('Skipping {}: {}'.format(fname, err))
+            continue
+        yield fname, tagr
+
+
+def supported(fnames, sniff=False):
+    return (fname for fname, _ in recognize(fnames, sniff))
+
+
+def get_tagger(fname, bounded=False, sniff=False, prefetched=None,
+               tagr=None):
+    if prefetched is not None:
+        tagr, region = prefetched
+        return tagr(fname, region=region)
+    if tagr is None:
+        tagr = detect(fname, sniff)
+    return tagr(fname, bounded=bounded)
+
+
+def read_ahead(fname, sniff=False, tagr=None):
+    """Detect the tagger of fname and read its tag region without parsing it
+
+    The result can be passed to get_tagger as prefetched. Files without a
+    tag region are parsed completely by get_tagger.
+    """
+    if tagr is None:
+        tagr = detect(fname, sniff)
+    region, _ = tagr.fetch_region(fname)
+    return tagr, region
 
 
 def bpm2str(value):
     return str(int(round(float(value))))
 
 
-def set_multiple_tags(fname, tags, prefix=''):
-    tagger = get_tagger(fname)
+def normalize(key, value):
+    if value is None:
+        return None
+    if key == 'bpm':
+        try:
+            return bpm2str(value)
+        except ValueError:
+            pass
+    return str(value)
+
+
+def current_value(tagger, key):
+    try:
+        return tagger[key]
+    except (KeyError, IndexError):
+        return None
+
+
+def set_multiple_tags(fname, tags, prefix='', padding=None, sniff=False,
+                      tagr=None):
+    tagger = get_tagger(fname, sniff=sniff, tagr=tagr)
     changed = False
     for key in FIELDS:
         value = tags.get(prefix + key, None)
-        if value is not None:
-            tagger[key] = value
-            changed = True
+        if value is None:
+            continue
+        if normalize(key, value) == normalize(key,
+                                              current_value(tagger, key)):
+            continue
+        tagger[key] = value
+        changed = True
     if changed:
-        tagger.save()
+        tagger.save(padding=padding)
+        return tagger
+    return None
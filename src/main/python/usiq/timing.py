@@ -0,0 +1,139 @@
+import json
+import heapq
+from array import array
+from collections import defaultdict
+from contextlib import contextmanager
+from time import perf_counter
+from logbook import info
+
+
+SLOWEST = 10
+
+# The active profile or recorder, timing is disabled while this is None
+active = None
+
+
+class Profile(object):
+    """Durations per phase and the slowest operations on single files"""
+
+    def __init__(self, slowest=SLOWEST):
+        self.slowest = slowest
+        self.durations = defaultdict(lambda: array('d'))
+        self.files = []
+
+    def add(self, phase, seconds, fname=None):
+        self.durations[phase].append(seconds)
+        if fname is None or not self.slowest:
+            return
+        sample = (seconds, phase, fname)
+        if len(self.files) < self.slowest:
+            heapq.heappush(self.files, sample)
+        elif seconds > self.files[0][0]:
+            heapq.heapreplace(self.files, sample)
+
+    def report(self):
+        return {'phases': {phase: summarize(durations)
+                           for phase, durations in self.durations.items()},
+                'slowest': [{'file': fname,
+                             'phase': phase,
+                             'seconds': seconds}
+                            for seconds, phase, fname
+                            in sorted(self.files, reverse=True)]}
+
+
+class Recorder(object):
+    """Keep samples in a worker process until they are sent to the parent"""
+
+    def __init__(self):
+        self.samples = []
+
+    def add(self, phase, seconds, fname=None):
+        self.samples.append((phase, seconds, fname))
+
+
+def summarize(durations):
+    ordered = sorted(durations)
+    return {'count': len(ordered),
+            'total': sum(ordered),
+            'p50': percentile(ordered, 50),
+            'p95': percentile(ordered, 95),
+            'max': ordered[-1]}
+
+
+def percentile(ordered, percent):
+    index = int(round(percent / 100 * (len(ordered) - 1)))
+    return ordered[index]
+
+
+def start():
+    if active is None:
+        return None
+    return perf_counter()
+
+
+def stop(phase, started, fname=None):
+    if started is not None:
+        active.add(phase, perf_counter() - started, fname)
+
+
+def enabled():
+    return active is not None
+
+
+def record():
+    global active
+    if not isinstance(active, Recorder):
+        active = Recorder()
+
+
+def drain():
+    if not isinstance(active, Recorder):
+        return []
+    samples, active.samples = active.samples, []
+    return samples
+
+
+def merge(samples):
+    for sample in samples:
+        active.add(*sample)
+
+
+@contextmanager
+def profiled(report=None, dump=None, slowest=SLOWEST):
+    """Collect timings while active and write them to report as JSON
+
+    If dump is given, the main process also runs under cProfile and its
+    statistics are written to dump (see the pstats module).
+    """
+    global active
+    if not report and not dump:
+        yield
+        return
+    active = Profile(slowest)
+    profiler = None
+    if dump:
+        import cProfile
+        profiler = cProfile.Profile()
+    started = perf_counter()
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(dump)
+        active.add('total', perf_counter() - started)
+        profile, active = active, None
+        if report:
+            write_report(profile, report)
+
+
+def write_report(profile, fname):
+    report = profile.report()
+    for phase, summary in sorted(report['phases'].items()):
+        info('{}: {} calls, p50 {:.2f} ms, p95 {:.2f} ms, max {:.2f} ms'
+             .format(phase, summary['count'], 1000 * summary['p50'],
+                     1000 * summary['p95'], 1000 * summary['max']))
+    with open(fname, 'w') as f:
+        json.dump(report, f, indent=1)
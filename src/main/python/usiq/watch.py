@@ -0,0 +1,155 @@
+import os
+import errno
+import select
+import struct
+from collections import OrderedDict
+from logbook import debug, warning
+
+from .discover import walk, is_supported
+
+
+# From <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+EVENT = struct.Struct('iIII')
+BUFFER_SIZE = 65536
+
+DEBOUNCE = 2.
+
+# The C library, loaded when the first directory is watched
+libc = None
+
+
+class InotifyError(Exception):
+    pass
+
+
+def inotify():
+    global libc
+    if libc is None:
+        import ctypes
+        library = ctypes.CDLL(None, use_errno=True)
+        if not hasattr(library, 'inotify_init1'):
+            raise InotifyError('Watching directories requires inotify')
+        library.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p,
+                                              ctypes.c_uint32]
+        libc = library
+    return libc
+
+
+def check(result):
+    if result < 0:
+        import ctypes
+        code = ctypes.get_errno()
+        raise OSError(code, os.strerror(code))
+    return result
+
+
+class Watcher(object):
+    """Report supported files below a directory once they are complete
+
+    Files count as complete when they are closed after writing or moved
+    into the watched tree. Directories that are created later are watched
+    as well, and the files of directories that are moved in are reported
+    right away. With sniff, files are reported whatever their extension.
+    """
+
+    def __init__(self, directory, sniff=False):
+        self.fd = check(inotify().inotify_init1(IN_CLOEXEC))
+        self.sniff = sniff
+        self.directories = {}
+        self.backlog = []
+        for subdirectory in directories(os.path.abspath(directory)):
+            self.add(subdirectory)
+
+    def add(self, directory):
+        try:
+            wd = check(inotify().inotify_add_watch(
+                self.fd, os.fsencode(directory), WATCH_MASK))
+        except OSError as err:
+            if err.errno != errno.ENOENT:
+                raise
+            return
+        self.directories[wd] = directory
+        debug('Watching {}'.format(directory))
+
+    def read(self, timeout=None):
+        """Return the files reported within timeout seconds
+
+        Returns None if there were no events at all within timeout.
+        """
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return None
+        data = os.read(self.fd, BUFFER_SIZE)
+        fnames = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT.unpack_from(data, offset)
+            offset += EVENT.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+            offset += length
+            fnames.extend(self.handle(wd, mask, name))
+        return fnames
+
+    def handle(self, wd, mask, name):
+        if mask & IN_Q_OVERFLOW:
+            warning('Too many events, some new files were missed')
+            return []
+        if mask & IN_IGNORED:
+            self.directories.pop(wd, None)
+            return []
+        path = os.path.join(self.directories[wd], name)
+        if mask & IN_ISDIR:
+            for subdirectory in directories(path):
+                self.add(subdirectory)
+            # Files in a directory that is still being created will be
+            # closed later on
+            if mask & IN_MOVED_TO:
+                return list(walk(path, sniff=self.sniff))
+            return []
+        if mask & IN_CREATE or not (self.sniff or is_supported(name)):
+            return []
+        return [path]
+
+    def batches(self, debounce=DEBOUNCE):
+        """Yield new files once no further file arrived for debounce seconds
+
+        Files are yielded in order of arrival and only once per batch.
+        """
+        while True:
+            batch = OrderedDict.fromkeys(self.backlog)
+            self.backlog = []
+            while not batch:
+                batch.update(OrderedDict.fromkeys(self.read()))
+            fnames = self.read(debounce)
+            while fnames is not None:
+                batch.update(OrderedDict.fromkeys(fnames))
+                fnames = self.read(debounce)
+            yield [fname for fname in batch if os.path.exists(fname)]
+
+    def discard(self, fnames):
+        """Drop the pending events for fnames, e.g. for files usiq wrote"""
+        fnames = set(fnames)
+        pending = self.read(0)
+        while pending is not None:
+            self.backlog.extend(fname for fname in pending
+                                if fname not in fnames)
+            pending = self.read(0)
+
+    def close(self):
+        os.close(self.fd)
+
+
+def directories(directory):
+    yield directory
+    for root, subdirectories, _ in os.walk(directory):
+        for subdirectory in subdirectories:
+            yield os.path.join(root, subdirectory)
@@ -0,0 +1,63 @@
+from unittest import TestCase
+import os
+import tempfile
+
+from usiq import cache
+
+
+class TestTagCache(TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.fname = os.path.join(self.tmpdir.name, 'ANY_FILE.mp3')
+        with open(self.fname, 'wb') as f:
+            f.write(b'ANY_CONTENT')
+        self.cache = cache.TagCache(os.path.join(self.tmpdir.name, 'cache'))
+
+    def tearDown(self):
+        self.cache.close()
+        self.tmpdir.cleanup()
+
+    def test_key_is_stat_based(self):
+        st = os.stat(self.fname)
+        self.assertEqual(self.cache.key(self.fname),
+                         (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns))
+
+    def test_missing_file_has_no_key(self):
+        self.assertIsNone(self.cache.key(self.fname + '.missing'))
+
+    def test_get_returns_stored_tags(self):
+        key = self.cache.key(self.fname)
+        self.cache.put(key, {'artist': 'ANY_ARTIST', 'bpm': 120})
+        self.assertDictEqual(self.cache.get(key),
+                             {'artist': 'ANY_ARTIST', 'bpm': 120})
+
+    def test_unknown_file_is_a_miss(self):
+        self.assertIsNone(self.cache.get(self.cache.key(self.fname)))
+
+    def test_modified_file_is_a_miss(self):
+        self.cache.put(self.cache.key(self.fname), {'artist': 'ANY_ARTIST'})
+        with open(self.fname, 'ab') as f:
+            f.write(b'MORE_CONTENT')
+        self.assertIsNone(self.cache.get(self.cache.key(self.fname)))
+
+    def test_renamed_file_is_a_hit(self):
+        self.cache.put(self.cache.key(self.fname), {'artist': 'ANY_ARTIST'})
+        new_fname = os.path.join(self.tmpdir.name, 'OTHER_FILE.mp3')
+        os.rename(self.fname, new_fname)
+        self.assertDictEqual(self.cache.get(self.cache.key(new_fname)),
+                             {'artist': 'ANY_ARTIST'})
+
+    def test_entries_survive_reopening(self):
+        key = self.cache.key(self.fname)
+        self.cache.put(key, {'artist': 'ANY_ARTIST'})
+        self.cache.close()
+        self.cache = cache.TagCache(os.path.join(self.tmpdir.name, 'cache'))
+        self.assertDictEqual(self.cache.get(key), {'artist': 'ANY_ARTIST'})
+
+
+class TestOpenCache(TestCase):
+
+    def test_no_filename_means_no_cache(self):
+        with cache.open_cache(None) as tag_cache:
+            self.assertIsNone(tag_cache)
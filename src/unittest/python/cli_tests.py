@@ -1,10 +1,15 @@
 from unittest import TestCase, mock
 from io import StringIO
+import os
+import json
 import yaml
+import shutil
+import struct
+import tempfile
 
 import logbook
 
-from usiq import cli
+from usiq import cli, tagger
 
 
 class TestShow(TestCase):
@@ -14,24 +19,41 @@ class TestShow(TestCase):
         mock_tagger.return_value = {'artist': 'ANY_ARTIST'}
         with logbook.TestHandler() as log_handler:
             cli.show('ANY_FILENAME')
-            mock_tagger.assert_called_once_with('ANY_FILENAME')
+            mock_tagger.assert_called_once_with('ANY_FILENAME',
+                                                bounded=False,
+                                                sniff=False)
             self.assertIn("{'artist': 'ANY_ARTIST'}",
                           log_handler.formatted_records[0])
 
+    @mock.patch('usiq.tagger.get_tagger')
+    def test_show_fields(self, mock_tagger):
+        mock_tagger.return_value.todict.return_value = {'bpm': '101'}
+        with logbook.TestHandler() as log_handler:
+            cli.show('ANY_FILENAME', fields='title, bpm')
+            mock_tagger.return_value.todict.assert_called_once_with(
+                ('title', 'bpm'))
+            self.assertIn("{'bpm': '101'}", log_handler.formatted_records[0])
+
+    def test_unknown_fields_fail(self):
+        with self.assertRaises(cli.UsiqError):
+            cli.parse_fields('title,INVALID_FIELD')
+
 
 class TestTag(TestCase):
 
     def setUp(self):
         self.patch_set_tags = mock.patch('usiq.tagger.set_multiple_tags')
-        self.patch_parse_filename = mock.patch('usiq.parser.parse_filename')
+        self.patch_compile_pattern = mock.patch(
+            'usiq.parser.compile_pattern')
         self.mock_set_tags = self.patch_set_tags.start()
-        self.mock_parse_filename = self.patch_parse_filename.start()
+        self.mock_compile_pattern = self.patch_compile_pattern.start()
+        self.mock_match = self.mock_compile_pattern.return_value.match
 
     def tearDown(self):
         mock.patch.stopall()
 
     def test_parsed_tags_take_precedence_over_config(self):
-        self.mock_parse_filename.return_value = {'artist': 'ANY_ARTIST'}
+        self.mock_match.return_value = {'artist': 'ANY_ARTIST'}
         args = {'--dry': False,
                 '--import': None,
                 '--artist': 'NOT_ARTIST',
@@ -39,14 +61,16 @@ class TestTag(TestCase):
 
         cli.tag(['ANY_FILENAME.mp3'], args)
 
-        self.mock_parse_filename.assert_called_once_with('ANY_FILENAME.mp3',
-                                                         '<artist>')
+        self.mock_compile_pattern.assert_called_once_with('<artist>')
+        self.mock_match.assert_called_once_with('ANY_FILENAME.mp3')
         self.mock_set_tags.assert_called_once_with('ANY_FILENAME.mp3',
                                                    {'artist': 'ANY_ARTIST'},
-                                                   prefix='')
+                                                   prefix='',
+                                                   padding=None,
+                                                   tagr=None)
 
     def test_no_default_tag_set_but_value_parsed_from_fname(self):
-        self.mock_parse_filename.return_value = {'artist': 'ANY_ARTIST'}
+        self.mock_match.return_value = {'artist': 'ANY_ARTIST'}
         args = {'--dry': False,
                 '--import': None,
                 '--artist': None,
@@ -54,14 +78,16 @@ class TestTag(TestCase):
 
         cli.tag(['ANY_FILENAME.mp3'], args)
 
-        self.mock_parse_filename.assert_called_once_with('ANY_FILENAME.mp3',
-                                                         '<artist>')
+        self.mock_compile_pattern.assert_called_once_with('<artist>')
+        self.mock_match.assert_called_once_with('ANY_FILENAME.mp3')
         self.mock_set_tags.assert_called_once_with('ANY_FILENAME.mp3',
                                                    {'artist': 'ANY_ARTIST'},
-                                                   prefix='')
+                                                   prefix='',
+                                                   padding=None,
+                                                   tagr=None)
 
     def test_neither_default_tag_nor_parsed_doesnt_touch_tag(self):
-        self.mock_parse_filename.return_value = {}
+        self.mock_match.return_value = {}
         args = {'--dry': False,
                 '--import': None,
                 '--artist': None,
@@ -69,14 +95,15 @@ class TestTag(TestCase):
 
         cli.tag(['ANY_FILENAME.mp3'], args)
 
-        self.mock_parse_filename.assert_called_once_with('ANY_FILENAME.mp3',
-                                                         'ANY_PATTERN')
+        self.mock_match.assert_called_once_with('ANY_FILENAME.mp3')
         self.mock_set_tags.assert_called_once_with('ANY_FILENAME.mp3',
                                                    {},
-                                                   prefix='')
+                                                   prefix='',
+                                                   padding=None,
+                                                   tagr=None)
 
     def test_dry_run_doesnt_set_tags(self):
-        self.mock_parse_filename.return_value = {'artist': 'ANY_ARTIST'}
+        self.mock_match.return_value = {'artist': 'ANY_ARTIST'}
         args = {'--dry': True, '--import': None, '--pattern': 'ANY_PATTERN'}
 
         cli.tag(['ANY_FILENAME.mp3'], args)
@@ -84,27 +111,32 @@ class TestTag(TestCase):
         self.mock_set_tags.assert_not_called()
 
     def test_multiple_filenames(self):
-        self.mock_parse_filename.return_value = {'artist': 'ANY_ARTIST'}
+        self.mock_match.return_value = {'artist': 'ANY_ARTIST'}
         args = {'--dry': False, '--import': None, '--pattern': 'ANY_PATTERN'}
 
         cli.tag(['FIRST_FILE.mp3', 'SECOND_FILE.flac'], args)
 
-        self.mock_parse_filename.assert_has_calls(
-            [mock.call('FIRST_FILE.mp3', 'ANY_PATTERN'),
-             mock.call('SECOND_FILE.flac', 'ANY_PATTERN')],
+        self.mock_compile_pattern.assert_called_once_with('ANY_PATTERN')
+        self.mock_match.assert_has_calls(
+            [mock.call('FIRST_FILE.mp3'),
+             mock.call('SECOND_FILE.flac')],
             any_order=True)
         self.mock_set_tags.assert_has_calls(
             [mock.call('FIRST_FILE.mp3',
                        {'artist': 'ANY_ARTIST'},
-                       prefix=''),
+                       prefix='',
+                       padding=None,
+                       tagr=None),
              mock.call('SECOND_FILE.flac',
                        {'artist': 'ANY_ARTIST'},
-                       prefix='')],
+                       prefix='',
+                       padding=None,
+                       tagr=None)],
             any_order=True)
 
     def test_logging_if_dry_run(self):
         with logbook.TestHandler() as log_handler:
-            self.mock_parse_filename.return_value = {}
+            self.mock_match.return_value = {}
             cli.tag(['ANY_FILENAME.mp3'],
                     {'--artist': 'ANY_ARTIST',
                      '--import': None,
@@ -116,7 +148,7 @@ class TestTag(TestCase):
 
     def test_logging_if_wet_run(self):
         with logbook.TestHandler() as log_handler:
-            self.mock_parse_filename.return_value = {}
+            self.mock_match.return_value = {}
             cli.tag(['ANY_FILENAME.mp3'],
                     {'--artist': 'ANY_ARTIST',
                      '--import': None,
@@ -126,46 +158,115 @@ class TestTag(TestCase):
                           " on file ANY_FILENAME.mp3")
             self.assertIn(should_log, log_handler.formatted_records[0])
 
+    def test_reports_written_and_unchanged_files(self):
+        self.mock_set_tags.side_effect = [mock.Mock(rewritten=True),
+                                          mock.Mock(rewritten=False),
+                                          None]
+        with logbook.TestHandler() as log_handler:
+            cli.tag(['FIRST.mp3', 'SECOND.mp3', 'THIRD.mp3'],
+                    {'--artist': 'ANY_ARTIST',
+                     '--import': None,
+                     '--dry': False,
+                     '--pattern': None,
+                     '--padding': '4'})
+            self.assertTrue(log_handler.has_debug(
+                'Wrote tags to 2 files (1 in place, 1 rewritten), '
+                '1 files were unchanged'))
+        self.mock_set_tags.assert_called_with('THIRD.mp3',
+                                              {'artist': 'ANY_ARTIST'},
+                                              prefix='',
+                                              padding=4096,
+                                              tagr=None)
+
+    def test_failing_file_does_not_stop_run(self):
+        self.mock_set_tags.side_effect = [ValueError('ANY_ERROR'), None]
+        with logbook.TestHandler() as log_handler:
+            cli.tag(['BROKEN_FILE.mp3', 'ANY_FILE.mp3'],
+                    {'--artist': 'ANY_ARTIST',
+                     '--import': None,
+                     '--dry': False,
+                     '--pattern': None,
+                     '--jobs': '1'})
+            self.assertTrue(log_handler.has_warning(
+                'Could not set tags on BROKEN_FILE.mp3: ValueError: '
+                'ANY_ERROR'))
+        self.mock_set_tags.assert_called_with('ANY_FILE.mp3',
+                                              {'artist': 'ANY_ARTIST'},
+                                              prefix='',
+                                              padding=None,
+                                              tagr=None)
+
+    def test_logging_is_in_input_order(self):
+        with logbook.TestHandler() as log_handler:
+            cli.tag(['FIRST_FILE.mp3', 'SECOND_FILE.mp3'],
+                    {'--artist': 'ANY_ARTIST',
+                     '--import': None,
+                     '--dry': False,
+                     '--pattern': None})
+            self.assertIn('FIRST_FILE.mp3', log_handler.formatted_records[0])
+            self.assertIn('SECOND_FILE.mp3', log_handler.formatted_records[1])
+
+    def test_files_not_matching_pattern_are_skipped(self):
+        self.mock_compile_pattern.return_value.pattern = '<artist>'
+        self.mock_match.side_effect = [None, {'artist': 'ANY_ARTIST'}]
+        args = {'--dry': False, '--import': None, '--pattern': '<artist>'}
+        with logbook.TestHandler() as log_handler:
+            cli.tag(['FIRST.mp3', 'SECOND.mp3'], args)
+        self.assertTrue(log_handler.has_warning(
+            'Skipping FIRST.mp3: it does not match the pattern <artist>'))
+        self.mock_set_tags.assert_called_once_with('SECOND.mp3',
+                                                   {'artist': 'ANY_ARTIST'},
+                                                   prefix='',
+                                                   padding=None,
+                                                   tagr=None)
+
     def test_no_pattern_no_parsing(self):
         cli.tag(['ANY_FILENAME.mp3'],
                 {'--artist': 'ANY_ARTIST',
                  '--import': None,
                  '--dry': False,
                  '--pattern': None})
-        self.mock_parse_filename.assert_not_called()
+        self.mock_compile_pattern.assert_not_called()
+        self.mock_match.assert_not_called()
         self.mock_set_tags.assert_called_once_with('ANY_FILENAME.mp3',
                                                    {'artist': 'ANY_ARTIST'},
-                                                   prefix='')
+                                                   prefix='',
+                                                   padding=None,
+                                                   tagr=None)
 
     @mock.patch('os.path.abspath')
     @mock.patch('builtins.open')
-    @mock.patch('yaml.load')
+    @mock.patch('usiq.tagfile.read_entries')
     def test_tags_are_read_from_yaml_file(self,
-                                          mock_load,
+                                          mock_read_entries,
                                           mock_open,
                                           mock_abspath):
-        mock_load.return_value = {'ANY_FILENAME.mp3': {'artist': 'ANY_ARTIST'}}
+        mock_read_entries.return_value = [('ANY_FILENAME.mp3',
+                                           {'artist': 'ANY_ARTIST'})]
         mock_abspath.side_effect = lambda fname: fname
         cli.tag(['ANY_FILENAME.mp3'],
                 {'--import': 'ANY_YAML',
                  '--dry': False,
                  '--pattern': None})
-        mock_load.assert_called_once_with(mock_open.return_value)
+        mock_read_entries.assert_called_once_with(mock_open.return_value,
+                                                  'yaml')
         self.mock_set_tags.assert_called_once_with('ANY_FILENAME.mp3',
                                                    {'artist': 'ANY_ARTIST'},
-                                                   prefix='')
+                                                   prefix='',
+                                                   padding=None,
+                                                   tagr=None)
 
     @mock.patch('os.path.abspath')
     @mock.patch('builtins.open')
-    @mock.patch('yaml.load')
+    @mock.patch('usiq.tagfile.read_entries')
     def test_pattern_takes_precedence_over_yaml(self,
-                                                mock_load,
+                                                mock_read_entries,
                                                 mock_open,
                                                 mock_abspath):
-        mock_load.return_value = {'FILENAME_ARTIST.mp3':
-                                  {'artist': 'ANY_ARTIST'}}
+        mock_read_entries.return_value = [('FILENAME_ARTIST.mp3',
+                                           {'artist': 'ANY_ARTIST'})]
         mock_abspath.side_effect = lambda fname: fname
-        self.mock_parse_filename.return_value = {'artist': 'FILENAME_ARTIST'}
+        self.mock_match.return_value = {'artist': 'FILENAME_ARTIST'}
         cli.tag(['FILENAME_ARTIST.mp3'],
                 {'--import': 'ANY_YAML',
                  '--dry': False,
@@ -173,17 +274,19 @@ class TestTag(TestCase):
         self.mock_set_tags.assert_called_once_with(
             'FILENAME_ARTIST.mp3',
             {'artist': 'FILENAME_ARTIST'},
-            prefix='')
+            prefix='',
+            padding=None,
+            tagr=None)
 
     @mock.patch('os.path.abspath')
     @mock.patch('builtins.open')
-    @mock.patch('yaml.load')
+    @mock.patch('usiq.tagfile.read_entries')
     def test_arguments_take_precendece_over_yaml(self,
-                                                 mock_load,
+                                                 mock_read_entries,
                                                  mock_open,
                                                  mock_abspath):
-        mock_load.return_value = {'ANY_FILE.mp3':
-                                  {'artist': 'ANY_ARTIST'}}
+        mock_read_entries.return_value = [('ANY_FILE.mp3',
+                                           {'artist': 'ANY_ARTIST'})]
         mock_abspath.side_effect = lambda fname: fname
         cli.tag(['ANY_FILE.mp3'],
                 {'--import': 'ANY_YAML',
@@ -193,7 +296,103 @@ class TestTag(TestCase):
         self.mock_set_tags.assert_called_once_with(
             'ANY_FILE.mp3',
             {'artist': 'OTHER ARTIST'},
-            prefix='')
+            prefix='',
+            padding=None,
+            tagr=None)
+
+    @mock.patch('os.path.abspath')
+    @mock.patch('builtins.open')
+    @mock.patch('usiq.tagfile.read_entries')
+    def test_json_lines_import(self,
+                               mock_read_entries,
+                               mock_open,
+                               mock_abspath):
+        mock_read_entries.return_value = []
+        mock_abspath.side_effect = lambda fname: fname
+        cli.tag(['ANY_FILE.mp3'],
+                {'--import': 'ANY_TAGS.jsonl',
+                 '--dry': False,
+                 '--pattern': None})
+        mock_read_entries.assert_called_once_with(mock_open.return_value,
+                                                  'jsonl')
+
+    @mock.patch('os.path.abspath')
+    @mock.patch('builtins.open')
+    @mock.patch('usiq.tagfile.read_entries')
+    def test_imported_tags_are_applied_while_parsing(self,
+                                                     mock_read_entries,
+                                                     mock_open,
+                                                     mock_abspath):
+        parsed = []
+
+        def entries():
+            for fname in ['FIRST.mp3', 'SECOND.mp3']:
+                parsed.append(fname)
+                yield fname, {'artist': fname}
+
+        mock_read_entries.return_value = entries()
+        mock_abspath.side_effect = lambda fname: fname
+        self.mock_set_tags.side_effect = lambda *args, **kwargs: (
+            self.assertListEqual(parsed, ['FIRST.mp3']))
+        cli.tag(['FIRST.mp3'],
+                {'--import': 'ANY_YAML',
+                 '--dry': False,
+                 '--pattern': None})
+        self.mock_set_tags.assert_called_once_with('FIRST.mp3',
+                                                   {'artist': 'FIRST.mp3'},
+                                                   prefix='',
+                                                   padding=None,
+                                                   tagr=None)
+
+
+class TestSniffedTag(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.fname = os.path.join(self.directory, 'misnamed.mp3')
+        streaminfo = (b'\x10\x00\x10\x00' + b'\x00' * 6 +
+                      struct.pack('>Q', (44100 << 44) | (1 << 41) |
+                                  (15 << 36) | 44100) +
+                      b'\x00' * 16)
+        comment = struct.pack('<I', 3) + b'ANY' + struct.pack('<I', 0)
+        with open(self.fname, 'wb') as f:
+            f.write(b'fLaC' +
+                    b'\x00' + struct.pack('>I', len(streaminfo))[1:] +
+                    streaminfo +
+                    b'\x84' + struct.pack('>I', len(comment))[1:] +
+                    comment +
+                    b'\xff\xf8' + b'\x00' * 64)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_sniffed_format_is_used_for_writing(self):
+        cli.tag([self.fname], {'--sniff': True,
+                               '--artist': 'ANY_ARTIST',
+                               '--dry': False,
+                               '--import': None,
+                               '--pattern': None})
+        from mutagen.flac import FLAC
+        self.assertListEqual(FLAC(self.fname)['artist'], ['ANY_ARTIST'])
+
+    def test_files_are_sniffed_once_for_writing(self):
+        with mock.patch('usiq.tagger.sniff_tagger',
+                        wraps=tagger.sniff_tagger) as mock_sniff:
+            cli.tag([self.fname], {'--sniff': True,
+                                   '--artist': 'ANY_ARTIST',
+                                   '--dry': False,
+                                   '--import': None,
+                                   '--pattern': None,
+                                   '--jobs': '1'})
+        mock_sniff.assert_called_once_with(self.fname)
+
+    def test_files_are_sniffed_once_for_reading(self):
+        with mock.patch('usiq.tagger.sniff_tagger',
+                        wraps=tagger.sniff_tagger) as mock_sniff:
+            tags = list(cli.read_all([self.fname], {'--sniff': True,
+                                                    '--jobs': '1'}))
+        mock_sniff.assert_called_once_with(self.fname)
+        self.assertEqual(tags[0][1]['artist'], None)
 
 
 class TestRename(TestCase):
@@ -201,21 +400,22 @@ class TestRename(TestCase):
     def setUp(self):
         self.patch_rename = mock.patch('os.rename')
         self.patch_get_tagger = mock.patch('usiq.tagger.get_tagger')
-        self.patch_path_exists = mock.patch('os.path.exists')
+        self.patch_listdir = mock.patch('os.listdir')
         self.patch_makedirs = mock.patch('os.makedirs')
         self.patch_expanduser = mock.patch('os.path.expanduser')
 
         self.mock_rename = self.patch_rename.start()
         self.mock_get_tagger = self.patch_get_tagger.start()
-        self.mock_path_exists = self.patch_path_exists.start()
+        self.mock_listdir = self.patch_listdir.start()
         self.mock_makedirs = self.patch_makedirs.start()
         self.mock_expanduser = self.patch_expanduser.start()
 
-        self.mock_get_tagger.return_value = {'artist': 'ANY_ARTIST',
-                                             'title': 'ANY_TITLE',
-                                             'bpm': '101'}
+        self.mock_get_tagger.return_value.todict.return_value = {
+            'artist': 'ANY_ARTIST',
+            'title': 'ANY_TITLE',
+            'bpm': '101'}
         self.mock_expanduser.side_effect = lambda x: x
-        self.mock_path_exists.return_value = False
+        self.mock_listdir.return_value = []
 
     def tearDown(self):
         mock.patch.stopall()
@@ -228,6 +428,10 @@ class TestRename(TestCase):
              mock.call('SECOND_FILE.flac', 'ANY_ARTIST.flac')],
             any_order=True)
 
+    def test_fails_without_pattern(self):
+        with self.assertRaises(cli.UsiqError):
+            cli.rename(['ANY_FILE.mp3'], {'--dry': False, '--pattern': None})
+
     def test_fails_for_empty_patterns(self):
         with self.assertRaises(cli.UsiqError):
             cli.rename(['ANY_FILE.mp3'],
@@ -263,13 +467,18 @@ class TestRename(TestCase):
         self.mock_rename.assert_called_once_with('ANY_FILE.ANY_EXTENSION',
                                                  'ANY_ARTIST.ANY_EXTENSION')
 
+    def test_fails_for_unknown_charset(self):
+        with self.assertRaises(cli.UsiqError):
+            cli.rename(['ANY_FILE.mp3'], {'--pattern': '<artist>',
+                                          '--charset': 'ANY_CHARSET'})
+
     def test_fails_if_pattern_has_extension(self):
         with self.assertRaises(cli.UsiqError):
             cli.rename(['ANY_FILE.mp3'],
                        {'--dry': False, '--pattern': '<artist>.mp3'})
 
     def test_does_not_move_to_existing_file(self):
-        self.mock_path_exists.return_value = True
+        self.mock_listdir.return_value = ['ANY_ARTIST.mp3']
         with logbook.TestHandler() as log_handler:
             cli.rename(['ANY_FILE.mp3'],
                        {'--dry': False, '--pattern': '<artist>'})
@@ -280,22 +489,186 @@ class TestRename(TestCase):
         self.mock_rename.assert_not_called()
 
     def test_creates_directory_if_non_existent(self):
-        self.mock_path_exists.side_effect = lambda x: (not x ==
-                                                       'ANY_FOLDER/ANY_ARTIST'
-                                                       '.mp3')
+        self.mock_listdir.side_effect = FileNotFoundError
         cli.rename(['ANY_FILE.mp3'],
                    {'--dry': False, '--pattern': 'ANY_FOLDER/<artist>'})
         self.mock_makedirs.assert_called_once_with('ANY_FOLDER', exist_ok=True)
         self.mock_rename.assert_called_once_with('ANY_FILE.mp3',
                                                  'ANY_FOLDER/ANY_ARTIST.mp3')
 
+    def test_creates_each_directory_once(self):
+        self.mock_get_tagger.return_value.todict.side_effect = [
+            {'artist': 'ANY_ARTIST', 'title': 'FIRST'},
+            {'artist': 'ANY_ARTIST', 'title': 'SECOND'}]
+        cli.rename(['FIRST.mp3', 'SECOND.mp3'],
+                   {'--dry': False, '--pattern': '<artist>/<title>'})
+        self.mock_makedirs.assert_called_once_with('ANY_ARTIST', exist_ok=True)
+        self.mock_listdir.assert_called_once_with('ANY_ARTIST')
+        self.assertEqual(self.mock_rename.call_count, 2)
+
+    def test_does_not_move_two_files_to_same_target(self):
+        with logbook.TestHandler() as log_handler:
+            cli.rename(['FIRST.mp3', 'SECOND.mp3'],
+                       {'--dry': False, '--pattern': '<artist>'})
+            self.assertTrue(log_handler.has_warning(
+                'Not moving SECOND.mp3 -> ANY_ARTIST.mp3, FIRST.mp3 is moved'
+                ' there already!'))
+        self.mock_rename.assert_called_once_with('FIRST.mp3',
+                                                 'ANY_ARTIST.mp3')
+
+    def test_nothing_is_moved_before_all_tags_are_read(self):
+        def todict():
+            self.mock_rename.assert_not_called()
+            return {'artist': next(artists)}
+
+        artists = iter(['FIRST', 'SECOND'])
+        self.mock_get_tagger.return_value.todict.side_effect = todict
+        cli.rename(['FIRST_FILE.mp3', 'SECOND_FILE.mp3'],
+                   {'--dry': False, '--pattern': '<artist>'})
+        self.assertEqual(self.mock_rename.call_count, 2)
+
+    @mock.patch('usiq.cli.open_file_or_stdinout')
+    def test_saved_plan_can_be_applied(self, mock_open):
+        plan_file = StringIO()
+        mock_open.return_value.__enter__.return_value = plan_file
+        cli.rename(['ANY_FILE.mp3'],
+                   {'--dry': True,
+                    '--pattern': '<artist>',
+                    '--save-plan': 'ANY_PLAN'})
+        self.mock_rename.assert_not_called()
+
+        plan_file.seek(0)
+        self.mock_get_tagger.reset_mock()
+        cli.apply('ANY_PLAN', {'--dry': False})
+        self.mock_get_tagger.assert_not_called()
+        self.mock_rename.assert_called_once_with(
+            os.path.abspath('ANY_FILE.mp3'),
+            os.path.abspath('ANY_ARTIST.mp3'))
+
     def test_rename_expands_username(self):
-        self.mock_path_exists.return_value = False
         cli.rename(['ANY_FILE.mp3'],
                    {'--dry': False, '--pattern': '<artist>'})
         print(self.mock_expanduser.mock_calls)
         self.mock_expanduser.assert_called_once_with('ANY_ARTIST')
 
+    @mock.patch('usiq.fileops.copy_file')
+    def test_copy_does_not_rename(self, mock_copy):
+        cli.copy(['ANY_FILE.mp3'],
+                 {'--dry': False, '--pattern': '<artist>'})
+        self.mock_rename.assert_not_called()
+        mock_copy.assert_called_once_with('ANY_FILE.mp3', 'ANY_ARTIST.mp3')
+
+
+@mock.patch('os.makedirs', mock.Mock())
+@mock.patch('os.listdir', mock.Mock(return_value=[]))
+class TestJournal(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.journal = os.path.join(self.directory, 'ANY_JOURNAL')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def tag_args(self, **args):
+        return dict({'--artist': 'ANY_ARTIST',
+                     '--import': None,
+                     '--dry': False,
+                     '--pattern': None}, **args)
+
+    def rename_args(self, **args):
+        return dict({'--dry': False, '--pattern': '<title>'}, **args)
+
+    @mock.patch('usiq.tagger.set_multiple_tags')
+    def test_resumed_tag_skips_done_files(self, mock_set_tags):
+        mock_set_tags.side_effect = [None, KeyboardInterrupt]
+        with self.assertRaises(KeyboardInterrupt):
+            cli.tag(['FIRST.mp3', 'SECOND.mp3'],
+                    self.tag_args(**{'--journal': self.journal}))
+
+        mock_set_tags.reset_mock(side_effect=True)
+        cli.tag(['FIRST.mp3', 'SECOND.mp3'],
+                self.tag_args(**{'--resume': self.journal}))
+        mock_set_tags.assert_called_once_with('SECOND.mp3',
+                                              {'artist': 'ANY_ARTIST'},
+                                              prefix='',
+                                              padding=None,
+                                              tagr=None)
+
+    @mock.patch('os.path.exists', mock.Mock(return_value=True))
+    @mock.patch('os.rename')
+    @mock.patch('usiq.tagger.get_tagger')
+    def test_resumed_rename_reads_no_tags(self, mock_get_tagger, mock_rename):
+        mock_get_tagger.return_value.todict.side_effect = [{'title': 'ONE'},
+                                                           {'title': 'TWO'}]
+        mock_rename.side_effect = [None, KeyboardInterrupt]
+        with self.assertRaises(KeyboardInterrupt):
+            cli.rename(['FIRST.mp3', 'SECOND.mp3'],
+                       self.rename_args(**{'--journal': self.journal}))
+
+        mock_get_tagger.reset_mock()
+        mock_rename.reset_mock(side_effect=True)
+        cli.rename([], self.rename_args(**{'--resume': self.journal}))
+        mock_get_tagger.assert_not_called()
+        mock_rename.assert_called_once_with(os.path.abspath('SECOND.mp3'),
+                                            os.path.abspath('TWO.mp3'))
+
+    @mock.patch('os.path.exists', mock.Mock(return_value=True))
+    @mock.patch('usiq.fileops.copy_file')
+    @mock.patch('usiq.tagger.get_tagger')
+    def test_resume_needs_no_pattern(self, mock_get_tagger, mock_copy):
+        mock_get_tagger.return_value.todict.side_effect = [{'title': 'ONE'},
+                                                           {'title': 'TWO'}]
+        mock_copy.side_effect = [None, KeyboardInterrupt]
+        with self.assertRaises(KeyboardInterrupt):
+            cli.copy(['FIRST.mp3', 'SECOND.mp3'],
+                     self.rename_args(**{'--journal': self.journal}))
+
+        mock_copy.reset_mock(side_effect=True)
+        cli.copy([], {'--dry': False,
+                      '--pattern': None,
+                      '--resume': self.journal})
+        mock_copy.assert_called_once_with(os.path.abspath('SECOND.mp3'),
+                                          os.path.abspath('TWO.mp3'))
+
+    @mock.patch('usiq.tagger.get_tagger')
+    def test_resume_redoes_incomplete_copy(self, mock_get_tagger):
+        mock_get_tagger.return_value.todict.return_value = {'title': 'ONE'}
+        source = os.path.join(self.directory, 'FIRST.mp3')
+        with open(source, 'wb') as f:
+            f.write(b'ANY_CONTENT')
+        with mock.patch('usiq.fileops.copy_file') as mock_copy:
+            mock_copy.side_effect = KeyboardInterrupt
+            with self.assertRaises(KeyboardInterrupt):
+                cli.copy([source], self.rename_args(**{
+                    '--pattern': os.path.join(self.directory, '<title>'),
+                    '--journal': self.journal}))
+        target = os.path.join(self.directory, 'ONE.mp3')
+        with open(target, 'wb') as f:
+            f.write(b'ANY')
+
+        cli.copy([], {'--dry': False,
+                      '--pattern': None,
+                      '--resume': self.journal})
+        with open(target, 'rb') as f:
+            self.assertEqual(f.read(), b'ANY_CONTENT')
+
+    @mock.patch('os.rename')
+    @mock.patch('usiq.tagger.get_tagger')
+    def test_undo_reverses_renames(self, mock_get_tagger, mock_rename):
+        mock_get_tagger.return_value.todict.side_effect = [{'title': 'ONE'},
+                                                           {'title': 'TWO'}]
+        cli.rename(['FIRST.mp3', 'SECOND.mp3'],
+                   self.rename_args(**{'--journal': self.journal}))
+
+        mock_rename.reset_mock()
+        cli.undo(self.journal, {'--dry': False})
+        mock_rename.assert_has_calls([
+            mock.call(os.path.abspath('TWO.mp3'),
+                      os.path.abspath('SECOND.mp3')),
+            mock.call(os.path.abspath('ONE.mp3'),
+                      os.path.abspath('FIRST.mp3'))])
+
 
 class TestExport(TestCase):
 
@@ -316,7 +689,7 @@ class TestExport(TestCase):
 
         mock_open.assert_called_once_with('out.yaml', 'w')
         fake_open_file.seek(0)
-        recovered_yaml = yaml.load(fake_open_file.read())
+        recovered_yaml = yaml.safe_load(fake_open_file.read())
         self.assertDictEqual(recovered_yaml,
                              {'/abs/FIRST_FILE.mp3': {'artist': 'FIRST'},
                               '/abs/SECOND_FILE.flac': {'artist': 'SECOND'}})
@@ -324,6 +697,176 @@ class TestExport(TestCase):
                                        mock.call('SECOND_FILE.flac')],
                                       any_order=True)
 
+    @mock.patch('usiq.cli.open_file_or_stdinout')
+    @mock.patch('usiq.tagger.get_tagger')
+    def test_unreadable_files_are_skipped(self, mock_get_tagger, mock_open):
+        fake_open_file = StringIO()
+        mock_open.return_value.__enter__.return_value = fake_open_file
+        mock_get_tagger.side_effect = [ValueError('ANY_ERROR'),
+                                       mock.DEFAULT]
+        mock_get_tagger.return_value.todict.return_value = {'artist': 'ANY'}
+
+        with logbook.TestHandler() as log_handler:
+            cli.export(['BROKEN_FILE.mp3', 'ANY_FILE.mp3'],
+                       {'--output': 'out.yaml', '--jobs': '1'})
+            self.assertIn('Could not read tags from BROKEN_FILE.mp3',
+                          log_handler.formatted_records[0])
+
+        self.assertIn('ANY_FILE.mp3', fake_open_file.getvalue())
+        self.assertNotIn('BROKEN_FILE.mp3', fake_open_file.getvalue())
+
+    @mock.patch('os.path.abspath', side_effect=lambda fn: '/abs/' + fn)
+    @mock.patch('usiq.cli.open_file_or_stdinout')
+    @mock.patch('usiq.tagger.get_tagger')
+    def test_json_lines(self, mock_get_tagger, mock_open, mock_abspath):
+        fake_open_file = StringIO()
+        mock_open.return_value.__enter__.return_value = fake_open_file
+        mock_get_tagger.return_value.todict.side_effect = [
+            {'artist': 'FIRST'},
+            {'artist': 'SECOND'},
+        ]
+
+        cli.export(['FIRST_FILE.mp3', 'SECOND_FILE.flac'],
+                   {'--output': 'out.jsonl'})
+
+        lines = fake_open_file.getvalue().splitlines()
+        self.assertListEqual(
+            [json.loads(line) for line in lines],
+            [{'path': '/abs/FIRST_FILE.mp3', 'artist': 'FIRST'},
+             {'path': '/abs/SECOND_FILE.flac', 'artist': 'SECOND'}])
+
+    @mock.patch('usiq.cli.open_file_or_stdinout')
+    @mock.patch('usiq.tagger.get_tagger')
+    def test_entries_are_written_while_reading(self,
+                                               mock_get_tagger,
+                                               mock_open):
+        fake_open_file = StringIO()
+        mock_open.return_value.__enter__.return_value = fake_open_file
+        written = []
+
+        def todict():
+            written.append(fake_open_file.getvalue())
+            return {'artist': 'ANY_ARTIST'}
+
+        mock_get_tagger.return_value.todict.side_effect = todict
+
+        cli.export(['FIRST_FILE.mp3', 'SECOND_FILE.mp3'],
+                   {'--output': 'out.yaml'})
+
+        self.assertEqual(written[0], '')
+        self.assertIn('FIRST_FILE.mp3', written[1])
+
+
+class TestFind(TestCase):
+
+    @mock.patch('builtins.print')
+    @mock.patch('usiq.tagger.get_tagger')
+    def test_prints_matching_files(self, mock_get_tagger, mock_print):
+        mock_get_tagger.return_value.todict.side_effect = [{'bpm': '120'},
+                                                           {'bpm': '90'}]
+        cli.find(['FIRST.mp3', 'SECOND.mp3'], ['bpm:100..130'],
+                 {'--import': None})
+        mock_print.assert_called_once_with('FIRST.mp3')
+
+    @mock.patch('builtins.print')
+    @mock.patch('usiq.tagger.get_tagger')
+    @mock.patch('builtins.open')
+    def test_searches_imported_files(self, mock_open, mock_get_tagger,
+                                     mock_print):
+        mock_open.return_value = StringIO(
+            '{"path": "/FIRST.mp3", "genre": "Techno"}\n'
+            '{"path": "/SECOND.mp3", "genre": "Deep House"}\n')
+        cli.find([], ['genre~house'], {'--import': 'ANY_FILE.jsonl'})
+        mock_get_tagger.assert_not_called()
+        mock_print.assert_called_once_with('/SECOND.mp3')
+
+
+class TestCache(TestCase):
+
+    def setUp(self):
+        self.patch_open_cache = mock.patch('usiq.cache.open_cache')
+        self.patch_get_tagger = mock.patch('usiq.tagger.get_tagger')
+        self.mock_open_cache = self.patch_open_cache.start()
+        self.mock_get_tagger = self.patch_get_tagger.start()
+        self.mock_cache = self.mock_open_cache.return_value.__enter__()
+        self.mock_cache.key.side_effect = lambda fname: 'KEY_' + fname
+
+    def tearDown(self):
+        mock.patch.stopall()
+
+    def test_read_all_uses_cached_tags(self):
+        self.mock_cache.get.return_value = {'artist': 'CACHED_ARTIST'}
+        tags = list(cli.read_all(['ANY_FILE.mp3'], {}, self.mock_cache))
+        self.assertListEqual(tags,
+                             [('ANY_FILE.mp3', {'artist': 'CACHED_ARTIST'})])
+        self.mock_get_tagger.assert_not_called()
+        self.mock_cache.put.assert_not_called()
+
+    def test_read_all_stores_parsed_tags(self):
+        self.mock_cache.get.return_value = None
+        self.mock_get_tagger.return_value.todict.return_value = {
+            'artist': 'ANY_ARTIST'}
+        tags = list(cli.read_all(['ANY_FILE.mp3'], {}, self.mock_cache))
+        self.assertListEqual(tags,
+                             [('ANY_FILE.mp3', {'artist': 'ANY_ARTIST'})])
+        self.mock_cache.put.assert_called_once_with('KEY_ANY_FILE.mp3',
+                                                    {'artist': 'ANY_ARTIST'})
+
+    def test_cached_tags_are_projected(self):
+        self.mock_cache.get.return_value = {'artist': 'CACHED_ARTIST',
+                                            'title': 'CACHED_TITLE'}
+        tags = list(cli.read_all(['ANY_FILE.mp3'], {}, self.mock_cache,
+                                 fields=('title',)))
+        self.assertListEqual(tags,
+                             [('ANY_FILE.mp3', {'title': 'CACHED_TITLE'})])
+
+    def test_projected_tags_are_not_stored(self):
+        self.mock_cache.get.return_value = None
+        self.mock_get_tagger.return_value.todict.return_value = {
+            'title': 'ANY_TITLE'}
+        list(cli.read_all(['ANY_FILE.mp3'], {}, self.mock_cache,
+                          fields=('title',)))
+        self.mock_get_tagger.return_value.todict.assert_called_once_with(
+            ('title',))
+        self.mock_cache.put.assert_not_called()
+
+    @mock.patch('usiq.tagger.read_ahead')
+    def test_prefetch_skips_cached_files(self, mock_read_ahead):
+        mock_read_ahead.return_value = ('ANY_TAGGER', 'ANY_REGION')
+        self.mock_cache.get.side_effect = [{'artist': 'CACHED_ARTIST'}, None]
+        self.mock_get_tagger.return_value.todict.return_value = {
+            'artist': 'ANY_ARTIST'}
+        tags = list(cli.read_all(['CACHED.mp3', 'NEW.mp3'],
+                                 {'--prefetch': '4', '--jobs': '0'},
+                                 self.mock_cache))
+        self.assertListEqual(tags,
+                             [('CACHED.mp3', {'artist': 'CACHED_ARTIST'}),
+                              ('NEW.mp3', {'artist': 'ANY_ARTIST'})])
+        mock_read_ahead.assert_called_once_with('NEW.mp3', tagr=None)
+        self.mock_get_tagger.assert_called_once_with(
+            'NEW.mp3', prefetched=('ANY_TAGGER', 'ANY_REGION'))
+
+    @mock.patch('usiq.tagger.set_multiple_tags')
+    def test_tag_updates_cache_after_save(self, mock_set_tags):
+        mock_set_tags.return_value.todict.return_value = {'artist': 'NEW'}
+        cli.tag(['ANY_FILE.mp3'], {'--artist': 'NEW',
+                                   '--import': None,
+                                   '--dry': False,
+                                   '--pattern': None,
+                                   '--cache': 'ANY_CACHE'})
+        self.mock_open_cache.assert_called_once_with('ANY_CACHE')
+        self.mock_cache.put.assert_called_once_with('KEY_ANY_FILE.mp3',
+                                                    {'artist': 'NEW'})
+
+    @mock.patch('usiq.tagger.set_multiple_tags')
+    def test_tag_does_not_update_cache_without_save(self, mock_set_tags):
+        mock_set_tags.return_value = None
+        cli.tag(['ANY_FILE.mp3'], {'--import': None,
+                                   '--dry': False,
+                                   '--pattern': None,
+                                   '--cache': 'ANY_CACHE'})
+        self.mock_cache.put.assert_not_called()
+
 
 class TestConfig(TestCase):
 
@@ -0,0 +1,74 @@
+from unittest import TestCase, mock
+from io import BytesIO
+import gzip
+
+from usiq import columnar
+
+
+class TestColumnar(TestCase):
+
+    entries = [('/ANY/FIRST.mp3', {'artist': 'ANY ARTIST',
+                                   'title': 'Fürst',
+                                   'bpm': '120'}),
+               ('/ANY/SECOND.m4a', {'artist': 'ANY ARTIST',
+                                    'title': None,
+                                    'bpm': 80})]
+
+    def dump(self, compression=None):
+        f = BytesIO()
+        writer = columnar.ColumnarWriter(f, compression)
+        for path, tags in self.entries:
+            writer.write(path, tags)
+        writer.close()
+        return f.getvalue()
+
+    def load(self, data):
+        return list(columnar.read_entries(BytesIO(data)))
+
+    def test_round_trip(self):
+        entries = self.load(self.dump())
+        self.assertListEqual([path for path, _ in entries],
+                             ['/ANY/FIRST.mp3', '/ANY/SECOND.m4a'])
+        self.assertEqual(entries[0][1]['title'], 'Fürst')
+        self.assertIsNone(entries[1][1]['title'])
+
+    def test_missing_fields_are_none(self):
+        entries = self.load(self.dump())
+        self.assertIsNone(entries[0][1]['album'])
+
+    def test_value_types_are_kept(self):
+        entries = self.load(self.dump())
+        self.assertEqual(entries[0][1]['bpm'], '120')
+        self.assertEqual(entries[1][1]['bpm'], 80)
+
+    def test_strings_are_interned(self):
+        writer = columnar.ColumnarWriter(BytesIO())
+        for path, tags in self.entries:
+            writer.write(path, tags)
+        artists = dict(writer.columns)['artist']
+        self.assertEqual(artists[0], artists[1])
+        self.assertEqual(writer.values.count('ANY ARTIST'), 1)
+
+    def test_gzip(self):
+        data = self.dump('gzip')
+        self.assertTrue(data.startswith(columnar.GZIP_MAGIC))
+        self.assertTrue(gzip.decompress(data).startswith(columnar.MAGIC))
+        self.assertEqual(self.load(data), self.load(self.dump()))
+
+    def test_empty_file(self):
+        writer = columnar.ColumnarWriter(BytesIO())
+        writer.close()
+        self.assertListEqual(self.load(writer.f.getvalue()), [])
+
+    @mock.patch('usiq.columnar.zstandard', None)
+    def test_zstd_requires_zstandard(self):
+        with self.assertRaises(columnar.ColumnarError):
+            columnar.ColumnarWriter(BytesIO(), 'zstd')
+
+    def test_unknown_compression(self):
+        with self.assertRaises(columnar.ColumnarError):
+            columnar.ColumnarWriter(BytesIO(), 'ANY_COMPRESSION')
+
+    def test_rejects_other_files(self):
+        with self.assertRaises(columnar.ColumnarError):
+            self.load(b'/ANY/FILE.mp3: {}')
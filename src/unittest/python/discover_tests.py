@@ -0,0 +1,78 @@
+from unittest import TestCase, mock
+from io import BytesIO
+import os
+import tempfile
+
+from usiq import discover
+
+
+class TestWalk(TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        for fname in ['b.mp3', 'a.FLAC', 'cover.jpg',
+                      'sub/c.m4a', 'sub/deeper/d.ogg', 'z/e.mp3']:
+            path = os.path.join(self.tmpdir.name, fname)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            open(path, 'w').close()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_finds_supported_files_depth_first_in_order(self):
+        fnames = [os.path.relpath(fname, self.tmpdir.name)
+                  for fname in discover.walk(self.tmpdir.name)]
+        self.assertListEqual(fnames, ['a.FLAC', 'b.mp3',
+                                      'sub/c.m4a', 'sub/deeper/d.ogg',
+                                      'z/e.mp3'])
+
+    def test_sniff_finds_all_files(self):
+        fnames = [os.path.relpath(fname, self.tmpdir.name)
+                  for fname in discover.walk(self.tmpdir.name, sniff=True)]
+        self.assertListEqual(fnames, ['a.FLAC', 'b.mp3', 'cover.jpg',
+                                      'sub/c.m4a', 'sub/deeper/d.ogg',
+                                      'z/e.mp3'])
+
+    def test_is_lazy(self):
+        fnames = discover.walk(self.tmpdir.name)
+        self.assertEqual(os.path.basename(next(fnames)), 'a.FLAC')
+
+
+class TestFileList(TestCase):
+
+    def test_split_nul(self):
+        stream = BytesIO(b'first.mp3\0second file.flac\0last.m4a')
+        self.assertListEqual(list(discover.split_nul(stream)),
+                             ['first.mp3', 'second file.flac', 'last.m4a'])
+
+    @mock.patch('usiq.discover.READ_SIZE', 3)
+    def test_split_nul_across_reads(self):
+        stream = BytesIO(b'first.mp3\0second.flac\0')
+        self.assertListEqual(list(discover.split_nul(stream)),
+                             ['first.mp3', 'second.flac'])
+
+
+class TestFindFiles(TestCase):
+
+    @mock.patch('usiq.discover.read_file_list')
+    @mock.patch('usiq.discover.walk')
+    def test_combines_all_sources(self, mock_walk, mock_read_file_list):
+        mock_walk.return_value = iter(['DIR/WALKED.mp3'])
+        mock_read_file_list.return_value = iter(['LISTED.flac', 'LISTED.txt'])
+        fnames = discover.find_files(['GIVEN.mp3'],
+                                     recursive='DIR',
+                                     files_from='-')
+        self.assertListEqual(list(fnames),
+                             ['GIVEN.mp3', 'DIR/WALKED.mp3', 'LISTED.flac'])
+        mock_walk.assert_called_once_with('DIR', sniff=False)
+        mock_read_file_list.assert_called_once_with('-')
+
+    @mock.patch('usiq.discover.read_file_list')
+    def test_sniff_keeps_all_listed_files(self, mock_read_file_list):
+        mock_read_file_list.return_value = iter(['LISTED.flac', 'LISTED.txt'])
+        fnames = discover.find_files([], files_from='-', sniff=True)
+        self.assertListEqual(list(fnames), ['LISTED.flac', 'LISTED.txt'])
+
+    def test_only_given_files(self):
+        fnames = discover.find_files(['ANY_FILE.ANY_EXTENSION'])
+        self.assertListEqual(list(fnames), ['ANY_FILE.ANY_EXTENSION'])
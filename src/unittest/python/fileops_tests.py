@@ -0,0 +1,172 @@
+from unittest import TestCase, mock
+import os
+import errno
+import shutil
+import tempfile
+
+from usiq import fileops
+
+
+class FileTestCase(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.source = os.path.join(self.directory, 'SOURCE.flac')
+        self.target = os.path.join(self.directory, 'TARGET.flac')
+        with open(self.source, 'wb') as f:
+            f.write(b'ANY_CONTENT' * 1000)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def assertCopied(self):
+        with open(self.target, 'rb') as f:
+            self.assertEqual(f.read(), b'ANY_CONTENT' * 1000)
+
+
+class TestCopyFile(FileTestCase):
+
+    def test_copies_content(self):
+        fileops.copy_file(self.source, self.target)
+        self.assertCopied()
+        self.assertTrue(os.path.exists(self.source))
+
+    def test_copies_modification_time(self):
+        os.utime(self.source, (1000000000, 1000000000))
+        fileops.copy_file(self.source, self.target)
+        self.assertEqual(os.stat(self.target).st_mtime, 1000000000)
+
+    @mock.patch('usiq.fileops.copy_loop')
+    @mock.patch('usiq.fileops.reflink', return_value=False)
+    def test_failed_copy_leaves_no_target(self, mock_reflink, mock_loop):
+        mock_loop.side_effect = OSError(errno.ENOSPC, 'No space left')
+        with self.assertRaises(OSError):
+            fileops.copy_file(self.source, self.target)
+        self.assertFalse(os.path.exists(self.target))
+        self.assertTrue(os.path.exists(self.source))
+        self.assertEqual(os.listdir(self.directory), ['SOURCE.flac'])
+
+    @mock.patch('usiq.fileops.copy_content')
+    def test_copies_under_temporary_name(self, mock_copy):
+        def copy_content(src, dst, size):
+            self.assertFalse(os.path.exists(self.target))
+            shutil.copyfileobj(src, dst)
+            return 'ANY_METHOD'
+        mock_copy.side_effect = copy_content
+        fileops.copy_file(self.source, self.target)
+        self.assertCopied()
+        self.assertEqual(sorted(os.listdir(self.directory)),
+                         ['SOURCE.flac', 'TARGET.flac'])
+
+    @mock.patch('usiq.fileops.copy_content')
+    def test_short_copy_fails(self, mock_copy):
+        mock_copy.side_effect = lambda src, dst, size: dst.write(b'ANY')
+        with self.assertRaises(OSError):
+            fileops.copy_file(self.source, self.target)
+        self.assertEqual(os.listdir(self.directory), ['SOURCE.flac'])
+
+    @mock.patch('os.link')
+    def test_renames_without_hard_links(self, mock_link):
+        mock_link.side_effect = OSError(errno.EPERM, 'ANY')
+        fileops.copy_file(self.source, self.target)
+        self.assertCopied()
+        self.assertEqual(sorted(os.listdir(self.directory)),
+                         ['SOURCE.flac', 'TARGET.flac'])
+
+    @mock.patch('usiq.fileops.copy_content')
+    def test_does_not_overwrite_file_created_during_copy(self, mock_copy):
+        def copy_content(src, dst, size):
+            open(self.target, 'w').close()
+            shutil.copyfileobj(src, dst)
+        mock_copy.side_effect = copy_content
+        with self.assertRaises(FileExistsError):
+            fileops.copy_file(self.source, self.target)
+        self.assertEqual(os.path.getsize(self.target), 0)
+
+    def test_does_not_overwrite(self):
+        open(self.target, 'w').close()
+        with self.assertRaises(FileExistsError):
+            fileops.copy_file(self.source, self.target)
+
+    @mock.patch('usiq.fileops.send_file', mock.Mock(return_value=False))
+    @mock.patch('usiq.fileops.copy_range', mock.Mock(return_value=False))
+    @mock.patch('usiq.fileops.reflink', mock.Mock(return_value=False))
+    def test_falls_back_to_buffered_copy(self):
+        fileops.copy_file(self.source, self.target)
+        self.assertCopied()
+
+    @mock.patch('usiq.fileops.copy_range', mock.Mock(return_value=False))
+    @mock.patch('usiq.fileops.reflink', mock.Mock(return_value=False))
+    def test_sendfile(self):
+        fileops.copy_file(self.source, self.target)
+        self.assertCopied()
+
+
+class TestCopyLoop(TestCase):
+
+    def test_unsupported_falls_back(self):
+        copy_chunk = mock.Mock(side_effect=OSError(errno.EXDEV, 'ANY'))
+        self.assertFalse(fileops.copy_loop(copy_chunk, 20))
+
+    def test_copies_until_done(self):
+        copy_chunk = mock.Mock(side_effect=[10, 10, 0])
+        self.assertTrue(fileops.copy_loop(copy_chunk, 20))
+        self.assertEqual(copy_chunk.call_count, 3)
+
+    def test_nothing_copied_falls_back(self):
+        copy_chunk = mock.Mock(return_value=0)
+        self.assertFalse(fileops.copy_loop(copy_chunk, 20))
+
+    def test_copies_empty_file(self):
+        copy_chunk = mock.Mock(return_value=0)
+        self.assertTrue(fileops.copy_loop(copy_chunk, 0))
+
+    def test_other_errors_are_raised(self):
+        copy_chunk = mock.Mock(side_effect=OSError(errno.ENOSPC, 'ANY'))
+        with self.assertRaises(OSError):
+            fileops.copy_loop(copy_chunk, 20)
+
+
+class TestMoveFile(FileTestCase):
+
+    def test_renames(self):
+        fileops.move_file(self.source, self.target)
+        self.assertCopied()
+        self.assertFalse(os.path.exists(self.source))
+
+    @mock.patch('os.rename')
+    def test_copies_across_devices(self, mock_rename):
+        mock_rename.side_effect = OSError(errno.EXDEV, 'ANY')
+        fileops.move_file(self.source, self.target)
+        self.assertCopied()
+        self.assertFalse(os.path.exists(self.source))
+
+    @mock.patch('os.rename')
+    def test_other_errors_are_raised(self, mock_rename):
+        mock_rename.side_effect = OSError(errno.EACCES, 'ANY')
+        with self.assertRaises(OSError):
+            fileops.move_file(self.source, self.target)
+        self.assertTrue(os.path.exists(self.source))
+
+    @mock.patch('usiq.fileops.copy_loop')
+    @mock.patch('usiq.fileops.reflink', return_value=False)
+    @mock.patch('os.rename')
+    def test_failed_copy_across_devices_keeps_source(self, mock_rename,
+                                                     mock_reflink, mock_loop):
+        mock_rename.side_effect = OSError(errno.EXDEV, 'ANY')
+        mock_loop.side_effect = OSError(errno.ENOSPC, 'No space left')
+        with self.assertRaises(OSError):
+            fileops.move_file(self.source, self.target)
+        self.assertFalse(os.path.exists(self.target))
+        self.assertTrue(os.path.exists(self.source))
+
+    @mock.patch('os.copy_file_range', create=True, return_value=0)
+    @mock.patch('usiq.fileops.reflink', return_value=False)
+    @mock.patch('os.rename')
+    def test_copy_range_without_effect_keeps_content(self, mock_rename,
+                                                     mock_reflink,
+                                                     mock_copy_range):
+        mock_rename.side_effect = OSError(errno.EXDEV, 'ANY')
+        fileops.move_file(self.source, self.target)
+        self.assertCopied()
+        self.assertFalse(os.path.exists(self.source))
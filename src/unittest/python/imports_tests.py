@@ -0,0 +1,50 @@
+from unittest import TestCase
+import os
+import sys
+import shutil
+import tempfile
+import subprocess
+
+
+# Import time of usiq.cli without logbook, in microseconds
+IMPORT_BUDGET = 100000
+MP3_FRAME = b'\xff\xfb\x90\x64' + b'\x00' * 413
+
+
+def import_times(code):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    process = subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+                             stderr=subprocess.PIPE, env=env, check=True)
+    times = {}
+    for line in process.stderr.decode().splitlines():
+        if line.startswith('import time:') and 'cumulative' not in line:
+            _, cumulative, module = line.split('|')
+            times[module.strip()] = int(cumulative)
+    return times
+
+
+class TestImports(TestCase):
+
+    def test_cli_defers_heavy_imports(self):
+        times = import_times('import usiq.cli')
+        for module in ('mutagen', 'yaml', 'sqlite3',
+                       'concurrent.futures.process'):
+            self.assertNotIn(module, times)
+
+    def test_cli_import_budget(self):
+        times = import_times('import logbook; import usiq.cli')
+        self.assertLess(times['usiq.cli'], IMPORT_BUDGET)
+
+    def test_only_modules_for_the_format_are_loaded(self):
+        directory = tempfile.mkdtemp()
+        try:
+            fname = os.path.join(directory, 'ANY_FILE.mp3')
+            with open(fname, 'wb') as f:
+                f.write(MP3_FRAME * 4)
+            times = import_times('from usiq import tagger; '
+                                 'tagger.get_tagger({!r})'.format(fname))
+        finally:
+            shutil.rmtree(directory)
+        self.assertIn('mutagen.mp3', times)
+        self.assertNotIn('mutagen.flac', times)
+        self.assertNotIn('mutagen.mp4', times)
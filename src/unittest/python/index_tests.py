@@ -0,0 +1,84 @@
+from unittest import TestCase
+
+from usiq import index
+
+
+ENTRIES = [('/FIRST.mp3', {'artist': 'ANY_ARTIST',
+                           'genre': 'Deep House',
+                           'key': '8A',
+                           'bpm': '124',
+                           'year': '1999-05-01'}),
+           ('/SECOND.flac', {'artist': 'OTHER_ARTIST',
+                             'genre': 'Techno',
+                             'key': '8A',
+                             'bpm': '128.4',
+                             'tracknumber': '3/12'}),
+           ('/THIRD.m4a', {'artist': 'ANY_ARTIST',
+                           'genre': 'House',
+                           'key': None,
+                           'bpm': '90'})]
+
+
+class TestTagIndex(TestCase):
+
+    def setUp(self):
+        self.index = index.TagIndex(ENTRIES)
+
+    def find(self, *terms):
+        return self.index.find(index.parse_query(terms))
+
+    def test_exact_values_ignore_case(self):
+        self.assertListEqual(self.find('key:8a'),
+                             ['/FIRST.mp3', '/SECOND.flac'])
+
+    def test_ranges_include_bounds(self):
+        self.assertListEqual(self.find('bpm:90..124'),
+                             ['/FIRST.mp3', '/THIRD.m4a'])
+
+    def test_open_ranges(self):
+        self.assertListEqual(self.find('bpm:125..'), ['/SECOND.flac'])
+        self.assertListEqual(self.find('year:..2000'), ['/FIRST.mp3'])
+
+    def test_numbers_are_parsed_leniently(self):
+        self.assertListEqual(self.find('tracknumber:3'), ['/SECOND.flac'])
+        self.assertListEqual(self.find('year:1999'), ['/FIRST.mp3'])
+
+    def test_substrings(self):
+        self.assertListEqual(self.find('genre~house'),
+                             ['/FIRST.mp3', '/THIRD.m4a'])
+        self.assertListEqual(self.find('bpm~12'),
+                             ['/FIRST.mp3', '/SECOND.flac'])
+
+    def test_predicates_are_combined(self):
+        self.assertListEqual(self.find('bpm:120..130', 'key:8A',
+                                       'genre~house'),
+                             ['/FIRST.mp3'])
+
+    def test_no_match(self):
+        self.assertListEqual(self.find('artist:NO_ARTIST', 'key:8A'), [])
+
+    def test_empty_query_matches_everything(self):
+        self.assertListEqual(self.find(),
+                             ['/FIRST.mp3', '/SECOND.flac', '/THIRD.m4a'])
+
+
+class TestParseQuery(TestCase):
+
+    def test_parses_predicates(self):
+        self.assertListEqual(
+            index.parse_query(['bpm:120..128', 'key:8A', 'genre~House']),
+            [('bpm', ':', (120., 128.)),
+             ('key', ':', '8a'),
+             ('genre', '~', 'house')])
+
+    def test_unknown_field_fails(self):
+        with self.assertRaises(index.QueryError):
+            index.parse_query(['INVALID_FIELD:ANY_VALUE'])
+
+    def test_invalid_range_fails(self):
+        with self.assertRaises(index.QueryError):
+            index.parse_query(['bpm:ANY_VALUE'])
+
+    def test_missing_operator_fails(self):
+        with self.assertRaises(index.QueryError):
+            index.parse_query(['ANY_VALUE'])
@@ -0,0 +1,65 @@
+from unittest import TestCase, mock
+import os
+import shutil
+import tempfile
+
+from usiq import journal
+
+
+class JournalTestCase(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.fname = os.path.join(self.directory, 'ANY_JOURNAL')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+
+class TestJournal(JournalTestCase):
+
+    def test_records_planned_and_done(self):
+        with journal.open_journal(self.fname) as log:
+            log.planned('tag', 'FIRST.mp3', tags={'title': 'ANY_TITLE'})
+            log.planned('tag', 'SECOND.mp3', tags={'title': 'ANY_TITLE'})
+            log.done('tag', 'FIRST.mp3')
+        progress = journal.read_journal(self.fname)
+        self.assertTrue(progress.is_done('tag', 'FIRST.mp3'))
+        self.assertFalse(progress.is_done('tag', 'SECOND.mp3'))
+        self.assertListEqual(progress.pending('tag'),
+                             [{'op': 'tag',
+                               'state': 'planned',
+                               'path': os.path.abspath('SECOND.mp3'),
+                               'tags': {'title': 'ANY_TITLE'}}])
+
+    def test_appends(self):
+        with journal.open_journal(self.fname) as log:
+            log.planned('rename', 'ANY_FILE.mp3', target='/ANY_TARGET.mp3')
+        with journal.open_journal(self.fname) as log:
+            log.done('rename', 'ANY_FILE.mp3', target='/ANY_TARGET.mp3')
+        progress = journal.read_journal(self.fname)
+        self.assertListEqual(progress.pending('rename'), [])
+        self.assertEqual(len(progress.completed('rename')), 1)
+
+    @mock.patch('os.fsync')
+    def test_syncs_in_batches(self, mock_fsync):
+        log = journal.Journal(self.fname, sync_interval=10)
+        for i in range(25):
+            log.done('tag', 'ANY_FILE.mp3')
+        self.assertEqual(mock_fsync.call_count, 2)
+        log.close()
+        self.assertEqual(mock_fsync.call_count, 3)
+
+    def test_skips_incomplete_lines(self):
+        with open(self.fname, 'w') as f:
+            f.write('{"op": "tag", "state": "done", "path": "/FIRST.mp3"}\n'
+                    '{"op": "tag", "sta')
+        with journal.open_journal(self.fname) as log:
+            log.done('tag', '/SECOND.mp3')
+        progress = journal.read_journal(self.fname)
+        self.assertTrue(progress.is_done('tag', '/FIRST.mp3'))
+        self.assertTrue(progress.is_done('tag', '/SECOND.mp3'))
+
+    def test_no_journal(self):
+        with journal.open_journal(None) as log:
+            self.assertIsNone(log)
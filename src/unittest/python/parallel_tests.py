@@ -0,0 +1,93 @@
+from unittest import TestCase, mock
+
+from usiq import parallel
+
+
+class TestNumJobs(TestCase):
+
+    def test_positive_values_are_kept(self):
+        self.assertEqual(parallel.num_jobs('3'), 3)
+
+    @mock.patch('os.cpu_count')
+    def test_zero_uses_cpu_count(self, mock_cpu_count):
+        mock_cpu_count.return_value = 8
+        self.assertEqual(parallel.num_jobs('0'), 8)
+
+
+class TestImap(TestCase):
+
+    def test_serial_results_are_in_order(self):
+        results = list(parallel.imap(int, ['1', '2', '3']))
+        self.assertListEqual(results, [('1', 1, None),
+                                       ('2', 2, None),
+                                       ('3', 3, None)])
+
+    def test_serial_errors_are_reported(self):
+        results = list(parallel.imap(int, ['1', 'ANY_STRING']))
+        self.assertEqual(results[0], ('1', 1, None))
+        item, result, error = results[1]
+        self.assertIsNone(result)
+        self.assertIn('ValueError', error)
+
+    def test_pool_results_are_in_order(self):
+        items = [str(i) for i in range(50)]
+        results = list(parallel.imap(int, items, jobs=2, chunksize=3))
+        self.assertListEqual([result for _, result, _ in results],
+                             list(range(50)))
+
+    def test_pool_errors_do_not_stop_run(self):
+        results = list(parallel.imap(int, ['1', 'ANY_STRING', '3'],
+                                     jobs=2, chunksize=1, window=1))
+        self.assertListEqual([result for _, result, _ in results],
+                             [1, None, 3])
+        self.assertIn('ValueError', results[1][2])
+
+    @mock.patch('concurrent.futures.ProcessPoolExecutor')
+    def test_single_chunk_runs_in_process(self, mock_executor):
+        results = list(parallel.imap(int, ['1', '2'], jobs=8, chunksize=2))
+        self.assertListEqual(results, [('1', 1, None), ('2', 2, None)])
+        mock_executor.assert_not_called()
+
+    def test_workers_are_capped_at_chunks(self):
+        from concurrent.futures import ProcessPoolExecutor
+        with mock.patch('concurrent.futures.ProcessPoolExecutor',
+                        wraps=ProcessPoolExecutor) as mock_executor:
+            results = list(parallel.imap(int, ['1', '2', '3'],
+                                         jobs=8, chunksize=1))
+        self.assertListEqual([result for _, result, _ in results], [1, 2, 3])
+        mock_executor.assert_called_once_with(3)
+
+
+class TestPrefetch(TestCase):
+
+    def test_results_are_in_order(self):
+        results = list(parallel.prefetch(int, ['1', '2', '3'], 2))
+        self.assertListEqual([(item, future.result())
+                              for item, future in results],
+                             [('1', 1), ('2', 2), ('3', 3)])
+
+    def test_reads_depth_items_ahead(self):
+        started = []
+
+        def record(item):
+            started.append(item)
+            return item
+
+        prefetched = parallel.prefetch(record, iter(range(10)), 3)
+        item, future = next(prefetched)
+        future.result()
+        self.assertEqual(item, 0)
+        self.assertLessEqual(len(started), 4)
+        prefetched.close()
+
+    def test_errors_are_raised_by_future(self):
+        (_, future), = parallel.prefetch(int, ['ANY_STRING'], 2)
+        with self.assertRaises(ValueError):
+            future.result()
+
+
+class TestChunked(TestCase):
+
+    def test_last_chunk_may_be_shorter(self):
+        chunks = list(parallel.chunked(range(5), 2))
+        self.assertListEqual(chunks, [[0, 1], [2, 3], [4]])
@@ -105,3 +105,39 @@ class TestGetFields(TestCase):
         fields = parser.get_fields('<artist.lower>_<title>')
         self.assertDictEqual(fields, {'artist': 'lower',
                                       'title': None})
+
+
+class TestCompiledPattern(TestCase):
+
+    @mock.patch('os.path.abspath')
+    def test_match(self, mock_abspath):
+        mock_abspath.return_value = '/ANY/PATH/ANY_ARTIST-ANY_TITLE.mp3'
+        pattern = parser.CompiledPattern('<artist>-<title>')
+        self.assertDictEqual(pattern.match('ANY_ARTIST-ANY_TITLE.mp3'),
+                             {'artist': 'ANY ARTIST', 'title': 'ANY TITLE'})
+
+    @mock.patch('os.path.abspath')
+    def test_no_match(self, mock_abspath):
+        mock_abspath.side_effect = lambda x: x
+        pattern = parser.CompiledPattern('<artist>-<title>')
+        self.assertIsNone(pattern.match('ANY_FILENAME.mp3'))
+
+    @mock.patch('os.path.abspath')
+    def test_match_many(self, mock_abspath):
+        mock_abspath.side_effect = lambda fname: '/ANY/PATH/' + fname
+        pattern = parser.CompiledPattern('<title>_(<bpm>BPM)')
+        tags = pattern.match_many(['FIRST_(80BPM).mp3', 'SECOND_(90BPM).mp3'])
+        self.assertListEqual(tags, [{'title': 'FIRST', 'bpm': '80'},
+                                    {'title': 'SECOND', 'bpm': '90'}])
+
+    def test_compile_pattern_is_memoized(self):
+        first = parser.compile_pattern('<artist>_-_<title>')
+        second = parser.compile_pattern('<artist>_-_<title>')
+        self.assertIs(first, second)
+
+    @mock.patch('usiq.parser.construct_regexp')
+    def test_regexp_is_only_built_once(self, mock_construct_regexp):
+        mock_construct_regexp.return_value = '(?P<title>[^/]+)$'
+        pattern = parser.CompiledPattern('<title>')
+        pattern.match_many(['FIRST.mp3', 'SECOND.mp3'])
+        mock_construct_regexp.assert_called_once_with('<title>')
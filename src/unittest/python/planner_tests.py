@@ -0,0 +1,122 @@
+from unittest import TestCase, mock
+from io import StringIO
+import os
+
+from usiq import planner, renamer
+
+
+class TestDirectoryCache(TestCase):
+
+    @mock.patch('os.listdir')
+    def test_lists_each_directory_once(self, mock_listdir):
+        mock_listdir.return_value = ['FIRST.mp3']
+        directories = planner.DirectoryCache()
+        self.assertTrue(directories.exists('ANY_DIR/FIRST.mp3'))
+        self.assertFalse(directories.exists('ANY_DIR/SECOND.mp3'))
+        mock_listdir.assert_called_once_with('ANY_DIR')
+
+    @mock.patch('os.listdir')
+    def test_current_directory(self, mock_listdir):
+        mock_listdir.return_value = []
+        planner.DirectoryCache().exists('ANY_FILE.mp3')
+        mock_listdir.assert_called_once_with(os.curdir)
+
+    @mock.patch('os.listdir')
+    def test_missing_directory_is_empty(self, mock_listdir):
+        mock_listdir.side_effect = FileNotFoundError
+        self.assertFalse(planner.DirectoryCache().exists('ANY_DIR/ANY.mp3'))
+
+
+@mock.patch('os.listdir', mock.Mock(return_value=['TAKEN.mp3']))
+class TestPlanRenames(TestCase):
+
+    template = renamer.Template('<title>')
+
+    def test_targets_get_source_extension(self):
+        plan = planner.plan_renames([('ANY_FILE.flac', {'title': 'NEW'})],
+                                    self.template)
+        self.assertListEqual(plan.moves, [('ANY_FILE.flac', 'NEW.flac')])
+
+    def test_existing_targets_are_skipped(self):
+        plan = planner.plan_renames([('ANY_FILE.mp3', {'title': 'TAKEN'})],
+                                    self.template)
+        self.assertListEqual(plan.moves, [])
+
+    def test_collisions_within_batch_are_skipped(self):
+        plan = planner.plan_renames([('FIRST.mp3', {'title': 'SAME'}),
+                                     ('SECOND.mp3', {'title': 'SAME'}),
+                                     ('SECOND.flac', {'title': 'SAME'})],
+                                    self.template)
+        self.assertListEqual(plan.moves, [('FIRST.mp3', 'SAME.mp3'),
+                                          ('SECOND.flac', 'SAME.flac')])
+
+
+class TestRenamePlan(TestCase):
+
+    def test_dump_and_load(self):
+        f = StringIO()
+        planner.RenamePlan([('/ANY/SOURCE.mp3', '/ANY/TARGET.mp3')]).dump(f)
+        f.seek(0)
+        self.assertListEqual(planner.RenamePlan.load(f).moves,
+                             [('/ANY/SOURCE.mp3', '/ANY/TARGET.mp3')])
+
+    def test_copy_is_kept(self):
+        f = StringIO()
+        planner.RenamePlan(copy=True).dump(f)
+        f.seek(0)
+        self.assertTrue(planner.RenamePlan.load(f).copy)
+
+
+@mock.patch('os.rename')
+@mock.patch('os.makedirs')
+class TestApplyPlan(TestCase):
+
+    plan = planner.RenamePlan([('FIRST.mp3', 'DIR/FIRST.mp3'),
+                               ('SECOND.mp3', 'DIR/SECOND.mp3'),
+                               ('THIRD.mp3', 'THIRD_NEW.mp3')])
+
+    def test_creates_each_directory_once(self, mock_makedirs, mock_rename):
+        planner.apply_plan(self.plan)
+        mock_makedirs.assert_called_once_with('DIR', exist_ok=True)
+        self.assertEqual(mock_rename.call_count, 3)
+
+    def test_dry_run(self, mock_makedirs, mock_rename):
+        planner.apply_plan(self.plan, dry=True)
+        mock_makedirs.assert_not_called()
+        mock_rename.assert_not_called()
+
+    @mock.patch('os.listdir')
+    def test_verify_skips_existing_targets(self,
+                                           mock_listdir,
+                                           mock_makedirs,
+                                           mock_rename):
+        mock_listdir.side_effect = lambda directory: (
+            ['SECOND.mp3'] if directory == 'DIR' else [])
+        planner.apply_plan(self.plan, verify=True)
+        mock_rename.assert_has_calls([
+            mock.call('FIRST.mp3', 'DIR/FIRST.mp3'),
+            mock.call('THIRD.mp3', 'THIRD_NEW.mp3')])
+        self.assertEqual(mock_rename.call_count, 2)
+
+    @mock.patch('os.path.lexists')
+    def test_never_overwrites(self,
+                              mock_lexists,
+                              mock_makedirs,
+                              mock_rename):
+        mock_lexists.side_effect = lambda fname: fname == 'DIR/SECOND.mp3'
+        planner.apply_plan(self.plan)
+        mock_rename.assert_has_calls([
+            mock.call('FIRST.mp3', 'DIR/FIRST.mp3'),
+            mock.call('THIRD.mp3', 'THIRD_NEW.mp3')])
+        self.assertEqual(mock_rename.call_count, 2)
+
+    @mock.patch('usiq.fileops.copy_file')
+    def test_copy_leaves_sources(self,
+                                 mock_copy,
+                                 mock_makedirs,
+                                 mock_rename):
+        plan = planner.RenamePlan(self.plan.moves, copy=True)
+        planner.apply_plan(plan)
+        mock_rename.assert_not_called()
+        mock_copy.assert_any_call('THIRD.mp3', 'THIRD_NEW.mp3')
+        self.assertEqual(mock_copy.call_count, 3)
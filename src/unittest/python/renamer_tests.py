@@ -61,3 +61,66 @@ class TestFilenames(TestCase):
     def test_upper_case_umlauts(self):
         valid = renamer.format_filename('this is ÖMÜR.mp3')
         self.assertEqual(valid, 'this is OMUR.mp3')
+
+    def test_control_characters(self):
+        valid = renamer.format_filename('any\tfile\x00.mp3')
+        self.assertEqual(valid, 'any_file_.mp3')
+
+
+class TestCharsets(TestCase):
+
+    def test_fat32_keeps_unicode(self):
+        valid = renamer.format_filename('Björk: Jóga [live] 7" mix?.mp3',
+                                        'fat32')
+        self.assertEqual(valid, 'Björk_ Jóga [live] 7in mix_.mp3')
+
+    def test_fat32_replaces_reserved_characters(self):
+        valid = renamer.format_filename('a\\b/c*d<e>f|g', 'fat32')
+        self.assertEqual(valid, 'a_b_c_d_e_f_g')
+
+    def test_unicode_only_replaces_separators(self):
+        valid = renamer.format_filename('AC/DC: "Live" ÖMÜR?', 'unicode')
+        self.assertEqual(valid, 'AC_DC: "Live" ÖMÜR?')
+
+    def test_template_uses_charset(self):
+        template = renamer.compile_template('<artist>', 'unicode')
+        self.assertEqual(template.render({'artist': 'Sigur Rós'}),
+                         'Sigur Rós')
+
+    def test_formatted_names_are_memoized(self):
+        renamer.format_filename.cache_clear()
+        renamer.format_filename('ANY ARTIST')
+        renamer.format_filename('ANY ARTIST')
+        self.assertEqual(renamer.format_filename.cache_info().hits, 1)
+
+
+class TestTemplate(TestCase):
+
+    def test_segments_split_literals_and_fields(self):
+        template = renamer.Template('<artist>_-_<title.upper>')
+        self.assertListEqual(template.segments,
+                             [(None, 'artist', None),
+                              ('_-_', None, None),
+                              (None, 'title', str.upper)])
+
+    def test_unknown_fields_stay_literal(self):
+        template = renamer.Template('<__any__>/<artist>')
+        self.assertListEqual(template.segments,
+                             [('<__any__>/', None, None),
+                              (None, 'artist', None)])
+
+    def test_render(self):
+        template = renamer.Template('<artist.upper> - <title>')
+        fname = template.render({'artist': 'any artist',
+                                 'title': 'ANY ? TITLE'})
+        self.assertEqual(fname, 'ANY ARTIST - ANY _ TITLE')
+
+    def test_repeated_fields_are_all_rendered(self):
+        template = renamer.Template('<artist>/<artist>')
+        fname = template.render({'artist': 'ANY ARTIST'})
+        self.assertEqual(fname, 'ANY ARTIST/ANY ARTIST')
+
+    def test_compile_template_is_memoized(self):
+        first = renamer.compile_template('<artist>')
+        second = renamer.compile_template('<artist>')
+        self.assertIs(first, second)
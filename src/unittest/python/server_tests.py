@@ -0,0 +1,107 @@
+from unittest import TestCase, mock
+import io
+import os
+import shutil
+import tempfile
+import threading
+
+from usiq import server, client
+
+DOC = """
+Usage:
+    usiq [options] show <FILE>
+    usiq [options] export [<PATH> ...]
+    usiq [options] serve [<SOCKET>]
+
+Options:
+    -v, --verbose
+    -i <FILE>, --import=<FILE>
+    --files-from=<FILE>
+    -o <FILE>, --output=<FILE>
+    --format=<FORMAT>
+    --compress=<METHOD>
+    -c <RCFILE>, --config=<RCFILE>  [default: ANY_RCFILE]
+"""
+
+
+@mock.patch('usiq.cli.load_config', return_value={})
+class TestServer(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'ANY_SOCKET')
+        self.server = server.Server(self.path, DOC)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+        shutil.rmtree(self.directory)
+
+    def request(self, argv):
+        out = io.StringIO()
+        status = client.request(argv, self.path, out)
+        return status, out.getvalue()
+
+    @mock.patch('usiq.cli.run')
+    def test_streams_output(self, mock_run, mock_load):
+        mock_run.side_effect = lambda args: print(args['<FILE>'])
+        status, output = self.request(['show', 'ANY_FILE.mp3'])
+        self.assertEqual(status, 0)
+        self.assertEqual(output, 'ANY_FILE.mp3\n')
+
+    @mock.patch('usiq.cli.run')
+    def test_runs_in_client_directory(self, mock_run, mock_load):
+        mock_run.side_effect = lambda args: print(os.getcwd())
+        cwd = os.getcwd()
+        os.chdir(self.directory)
+        try:
+            status, output = self.request(['show', 'ANY_FILE.mp3'])
+        finally:
+            os.chdir(cwd)
+        self.assertEqual(output.strip(), os.path.realpath(self.directory))
+        self.assertEqual(os.getcwd(), cwd)
+
+    @mock.patch('usiq.cli.run')
+    def test_reports_errors(self, mock_run, mock_load):
+        mock_run.side_effect = ValueError('ANY_ERROR')
+        status, output = self.request(['show', 'ANY_FILE.mp3'])
+        self.assertEqual(status, 1)
+        self.assertEqual(output, 'ValueError: ANY_ERROR\n')
+
+    @mock.patch('usiq.cli.run')
+    def test_rejects_invalid_arguments(self, mock_run, mock_load):
+        status, output = self.request(['ANY_ACTION'])
+        self.assertEqual(status, 1)
+        self.assertIn('Usage:', output)
+        mock_run.assert_not_called()
+
+    @mock.patch('usiq.cli.run')
+    def test_rejects_stdin(self, mock_run, mock_load):
+        for argv in (['-i', '-', 'export'], ['--files-from', '-', 'export']):
+            status, output = self.request(argv)
+            self.assertEqual(status, 1)
+            self.assertIn('pass a file instead', output)
+        mock_run.assert_not_called()
+
+    @mock.patch('usiq.cli.run')
+    def test_rejects_binary_output_to_stdout(self, mock_run, mock_load):
+        status, output = self.request(['-o', '-', '--format=columnar',
+                                       'export'])
+        self.assertEqual(status, 1)
+        self.assertIn('Binary output', output)
+        mock_run.assert_not_called()
+
+    @mock.patch('usiq.cli.run')
+    def test_writes_text_output_to_stdout(self, mock_run, mock_load):
+        status, output = self.request(['-o', '-', 'export'])
+        self.assertEqual(status, 0)
+        mock_run.assert_called_once()
+
+    @mock.patch('usiq.cli.run')
+    def test_caches_config(self, mock_run, mock_load):
+        self.request(['show', 'ANY_FILE.mp3'])
+        self.request(['show', 'ANY_FILE.mp3'])
+        mock_load.assert_called_once_with('ANY_RCFILE')
@@ -0,0 +1,122 @@
+from unittest import TestCase
+from io import StringIO
+import json
+import yaml
+
+from usiq import tagfile
+
+
+class TestGuessFormat(TestCase):
+
+    def test_explicit_format_wins(self):
+        self.assertEqual(tagfile.guess_format('tags.yaml', 'jsonl'), 'jsonl')
+
+    def test_extension(self):
+        self.assertEqual(tagfile.guess_format('tags.JSONL'), 'jsonl')
+        self.assertEqual(tagfile.guess_format('tags.yml'), 'yaml')
+
+    def test_compressed_columnar(self):
+        self.assertEqual(tagfile.guess_format('tags.usiq.gz'), 'columnar')
+        self.assertEqual(tagfile.guess_compression('tags.usiq.gz'), 'gzip')
+        self.assertEqual(tagfile.guess_compression('tags.usiq.zst'), 'zstd')
+        self.assertIsNone(tagfile.guess_compression('tags.usiq'))
+
+    def test_only_columnar_is_binary(self):
+        self.assertTrue(tagfile.is_binary('columnar'))
+        self.assertFalse(tagfile.is_binary('yaml'))
+
+    def test_text_formats_cannot_be_compressed(self):
+        with self.assertRaises(tagfile.UnknownFormatError):
+            tagfile.get_writer(StringIO(), 'yaml', 'gzip')
+
+    def test_stdout_defaults_to_yaml(self):
+        self.assertEqual(tagfile.guess_format('-'), 'yaml')
+
+    def test_unknown_format(self):
+        with self.assertRaises(tagfile.UnknownFormatError):
+            tagfile.guess_format('tags.yaml', 'xml')
+
+
+class TestWriters(TestCase):
+
+    entries = [('/ANY/FIRST.mp3', {'artist': 'FIRST', 'bpm': '120'}),
+               ('/ANY/SECOND.mp3', {'artist': None, 'bpm': '80'})]
+
+    def write(self, fmt):
+        f = StringIO()
+        writer = tagfile.get_writer(f, fmt)
+        for path, tags in self.entries:
+            writer.write(path, tags)
+        writer.close()
+        return f.getvalue()
+
+    def test_yaml_entries_form_one_mapping(self):
+        self.assertDictEqual(yaml.safe_load(self.write('yaml')),
+                             dict(self.entries))
+
+    def test_yaml_keeps_numbers_as_strings(self):
+        tags = yaml.safe_load(self.write('yaml'))
+        self.assertEqual(tags['/ANY/FIRST.mp3']['bpm'], '120')
+
+    def test_json_lines(self):
+        lines = self.write('jsonl').splitlines()
+        self.assertDictEqual(json.loads(lines[1]),
+                             {'path': '/ANY/SECOND.mp3',
+                              'artist': None,
+                              'bpm': '80'})
+
+
+class TestReaders(TestCase):
+
+    def test_yaml_round_trip(self):
+        f = StringIO()
+        writer = tagfile.get_writer(f, 'yaml')
+        writer.write('/ANY/FIRST.mp3', {'artist': 'FIRST', 'bpm': '120'})
+        writer.write('/ANY/SECOND.mp3', {'artist': None})
+        f.seek(0)
+        self.assertListEqual(list(tagfile.read_entries(f, 'yaml')),
+                             [('/ANY/FIRST.mp3',
+                               {'artist': 'FIRST', 'bpm': '120'}),
+                              ('/ANY/SECOND.mp3', {'artist': None})])
+
+    def test_yaml_is_read_lazily(self):
+        f = StringIO('/ANY/FIRST.mp3: {artist: FIRST}\n'
+                     '/ANY/SECOND.mp3: [this is: {not valid\n')
+        entries = tagfile.read_entries(f, 'yaml')
+        self.assertEqual(next(entries),
+                         ('/ANY/FIRST.mp3', {'artist': 'FIRST'}))
+
+    def test_empty_yaml(self):
+        self.assertListEqual(list(tagfile.read_entries(StringIO(''),
+                                                       'yaml')),
+                             [])
+
+    def test_json_lines(self):
+        f = StringIO('{"path": "/ANY/FIRST.mp3", "artist": "FIRST"}\n\n')
+        self.assertListEqual(list(tagfile.read_entries(f, 'jsonl')),
+                             [('/ANY/FIRST.mp3', {'artist': 'FIRST'})])
+
+
+class TestTagLookup(TestCase):
+
+    def test_in_order_lookups(self):
+        lookup = tagfile.TagLookup([('FIRST', {'artist': 'A'}),
+                                    ('SECOND', {'artist': 'B'})])
+        self.assertDictEqual(lookup.pop('FIRST'), {'artist': 'A'})
+        self.assertDictEqual(lookup.pending, {})
+        self.assertDictEqual(lookup.pop('SECOND'), {'artist': 'B'})
+
+    def test_out_of_order_lookups(self):
+        lookup = tagfile.TagLookup([('FIRST', {'artist': 'A'}),
+                                    ('SECOND', {'artist': 'B'})])
+        self.assertDictEqual(lookup.pop('SECOND'), {'artist': 'B'})
+        self.assertDictEqual(lookup.pop('FIRST'), {'artist': 'A'})
+
+    def test_missing_path(self):
+        lookup = tagfile.TagLookup([('FIRST', {'artist': 'A'})])
+        self.assertDictEqual(lookup.pop('OTHER'), {})
+        self.assertDictEqual(lookup.pop('FIRST'), {'artist': 'A'})
+
+    def test_null_entries_are_empty(self):
+        lookup = tagfile.TagLookup([('FIRST', None)])
+        self.assertDictEqual(lookup.pop('FIRST'), {})
@@ -1,6 +1,9 @@
 from unittest import TestCase, mock
+from io import BytesIO
+import struct
 import logbook
 from mutagen import id3
+from mutagen._tags import PaddingInfo
 
 from usiq import tagger
 
@@ -23,6 +26,24 @@ class TestBpm2Str(TestCase):
         self.assertEqual(tagger.bpm2str('1.8'), '2')
 
 
+class TestPaddingPolicy(TestCase):
+
+    def test_existing_padding_is_kept(self):
+        policy = tagger.PaddingPolicy(4096)
+        self.assertEqual(policy(PaddingInfo(100000, 1000000)), 100000)
+        self.assertFalse(policy.rewritten)
+
+    def test_reserve_on_rewrite(self):
+        policy = tagger.PaddingPolicy(4096)
+        self.assertEqual(policy(PaddingInfo(-10, 1000000)), 4096)
+        self.assertTrue(policy.rewritten)
+
+    def test_default_reserve(self):
+        policy = tagger.PaddingPolicy()
+        info = PaddingInfo(-10, 1000000)
+        self.assertEqual(policy(info), info.get_default_padding())
+
+
 class TestTagger(TestCase):
 
     @mock.patch('mutagen.File')
@@ -35,7 +56,15 @@ class TestTagger(TestCase):
 
         mock_tags.assert_not_called()
         t.save()
-        mock_tags.save.assert_called_once_with()
+        mock_tags.save.assert_called_once_with(padding=mock.ANY)
+
+    @mock.patch('mutagen.File')
+    def test_save_reports_rewrites(self, mock_file):
+        mock_file.return_value.save.side_effect = (
+            lambda padding: padding(PaddingInfo(-1, 1000)))
+        t = tagger.Tagger('ANY_FILE')
+        t.save(padding=2048)
+        self.assertTrue(t.rewritten)
 
     @mock.patch('mutagen.File')
     def test_string_creation(self, mock_file):
@@ -74,6 +103,31 @@ class TestMp3Tagger(TestCase):
             'TIT2',
             id3.TIT2(text=['ANY_TITLE']))
 
+    def id3_tags(self, version, **frames):
+        tags = id3.ID3()
+        tags.version = version
+        for name, text in frames.items():
+            tags.add(getattr(id3, name)(text=[text]))
+        return tags
+
+    @mock.patch('mutagen.File')
+    def test_get_many_reads_only_requested_fields(self, mock_file):
+        mock_file.return_value = self.id3_tags((2, 4, 0),
+                                               TIT2='ANY_TITLE',
+                                               TDRC='1999')
+        t = tagger.Mp3Tagger('ANY_FILE')
+        self.assertDictEqual(t.get_many(['title', 'year', 'bpm']),
+                             {'title': 'ANY_TITLE',
+                              'year': '1999',
+                              'bpm': None})
+
+    @mock.patch('mutagen.File')
+    def test_year_frame_depends_on_version(self, mock_file):
+        mock_file.return_value = self.id3_tags((2, 3, 0), TYER='1999')
+        t = tagger.Mp3Tagger('ANY_FILE')
+        self.assertEqual(t.translate_key('year'), 'TYER')
+        self.assertDictEqual(t.todict(['year']), {'year': '1999'})
+
 
 class TestFlacTagger(TestCase):
 
@@ -139,6 +193,16 @@ class TestM4aTagger(TestCase):
         mock_tags.__getitem__.return_value.__setitem__.assert_called_once_with(
             0, (6, 10))
 
+    def test_key_atom_is_searched_once(self):
+        mock_tags = self.mock_mutagen.return_value
+        mock_tags.__iter__.return_value = ['\xa9nam',
+                                           '----:com.apple.iTunes:initialkey']
+        t = tagger.M4aTagger('ANY_FILE')
+        self.assertEqual(t.translate_key('key'),
+                         '----:com.apple.iTunes:initialkey')
+        t.translate_key('key')
+        mock_tags.__iter__.assert_called_once_with()
+
     def test_warning_when_getting_key(self):
         with logbook.TestHandler() as log_handler:
             t = tagger.M4aTagger('ANY_FILE')
@@ -154,6 +218,98 @@ class TestM4aTagger(TestCase):
                 'Keys are not supported for M4A files')
 
 
+class TestBoundedRead(TestCase):
+
+    def flac_block(self, block_type, data, last=False):
+        header = bytes([block_type | (0x80 if last else 0)])
+        return header + struct.pack('>I', len(data))[1:] + data
+
+    def test_mp3_reads_only_id3_header_region(self):
+        data = b'ID3\x04\x00\x00\x00\x00\x01\x00' + b'F' * 128 + b'AUDIO'
+        reader = tagger.RegionReader(BytesIO(data))
+        t = tagger.Mp3Tagger.__new__(tagger.Mp3Tagger)
+        region = t.read_tag_region(reader)
+        self.assertEqual(region, data[:138])
+        self.assertEqual(reader.bytes_read, 138)
+
+    def test_mp3_without_id3_header_has_no_region(self):
+        reader = tagger.RegionReader(BytesIO(b'\xff\xfb\x90\x64' * 10))
+        t = tagger.Mp3Tagger.__new__(tagger.Mp3Tagger)
+        self.assertIsNone(t.read_tag_region(reader))
+
+    def test_flac_skips_pictures_and_padding(self):
+        data = (b'fLaC' +
+                self.flac_block(0, b'S' * 34) +
+                self.flac_block(6, b'P' * 1000) +
+                self.flac_block(4, b'V' * 20) +
+                self.flac_block(1, b'\x00' * 500, last=True) +
+                b'AUDIO')
+        reader = tagger.RegionReader(BytesIO(data))
+        t = tagger.FlacTagger.__new__(tagger.FlacTagger)
+        region = t.read_tag_region(reader)
+        self.assertEqual(region,
+                         b'fLaC' +
+                         self.flac_block(0, b'S' * 34) +
+                         self.flac_block(4, b'V' * 20, last=True))
+        self.assertEqual(reader.bytes_read, 4 + 4 * 4 + 34 + 20)
+
+    def test_m4a_reads_only_moov_header_and_udta(self):
+        udta = tagger.make_atom(b'udta', b'U' * 30)
+        mvhd = tagger.make_atom(b'mvhd', b'M' * 100)
+        trak = tagger.make_atom(b'trak', b'T' * 5000)
+        data = (tagger.make_atom(b'ftyp', b'M4A \x00\x00\x00\x00') +
+                tagger.make_atom(b'mdat', b'\x00' * 10000) +
+                tagger.make_atom(b'moov', mvhd + trak + udta))
+        reader = tagger.RegionReader(BytesIO(data))
+        t = tagger.M4aTagger.__new__(tagger.M4aTagger)
+        region = t.read_tag_region(reader)
+        self.assertEqual(region, tagger.make_atom(b'moov', mvhd + udta))
+        self.assertLess(reader.bytes_read, 200)
+
+    @mock.patch('mutagen.File')
+    @mock.patch('builtins.open')
+    def test_falls_back_to_full_parse_without_region(self,
+                                                     mock_open,
+                                                     mock_file):
+        mock_open.return_value = BytesIO(b'NOT_A_TAG_REGION')
+        t = tagger.Mp3Tagger('ANY_FILE', bounded=True)
+        mock_file.assert_called_once_with('ANY_FILE', options=mock.ANY)
+        self.assertFalse(t.bounded)
+        self.assertEqual(t.bytes_read, 10)
+
+    @mock.patch('mutagen.File')
+    @mock.patch('builtins.open')
+    def test_bounded_tags_are_read_only(self, mock_open, mock_file):
+        mock_open.return_value = BytesIO(b'ID3\x04\x00\x00\x00\x00\x00\x00')
+        t = tagger.Mp3Tagger('ANY_FILE', bounded=True)
+        mock_file.assert_not_called()
+        self.assertIsNone(t['title'])
+        with self.assertRaises(tagger.ReadOnlyTaggerError):
+            t.save()
+
+    @mock.patch('mutagen.File')
+    @mock.patch('builtins.open')
+    def test_prefetched_region_is_parsed_from_memory(self, mock_open,
+                                                     mock_file):
+        mock_open.return_value = BytesIO(b'ID3\x04\x00\x00\x00\x00\x00\x00')
+        prefetched = tagger.read_ahead('ANY_FILE.mp3')
+        mock_open.reset_mock()
+        t = tagger.get_tagger('ANY_FILE.mp3', prefetched=prefetched)
+        self.assertIsInstance(t, tagger.Mp3Tagger)
+        self.assertTrue(t.bounded)
+        mock_open.assert_not_called()
+        mock_file.assert_not_called()
+
+    @mock.patch('mutagen.File')
+    @mock.patch('builtins.open')
+    def test_prefetch_without_region_parses_file(self, mock_open, mock_file):
+        mock_open.return_value = BytesIO(b'NOT_A_TAG_REGION')
+        prefetched = tagger.read_ahead('ANY_FILE.mp3')
+        t = tagger.get_tagger('ANY_FILE.mp3', prefetched=prefetched)
+        self.assertFalse(t.bounded)
+        mock_file.assert_called_once_with('ANY_FILE.mp3', options=mock.ANY)
+
+
 class TestGetTagger(TestCase):
 
     @mock.patch('mutagen.File')
@@ -182,6 +338,54 @@ class TestGetTagger(TestCase):
             tagger.get_tagger('ANY_FILE')
 
 
+class TestSniffing(TestCase):
+
+    @mock.patch('builtins.open')
+    def check_sniffed(self, head, expected, mock_open):
+        mock_open.return_value = BytesIO(head)
+        self.assertIs(tagger.sniff_tagger('ANY_FILE'), expected)
+
+    def test_id3_is_mp3(self):
+        self.check_sniffed(b'ID3\x03\x00\x00\x00\x00\x00\x00',
+                           tagger.Mp3Tagger)
+
+    def test_mpeg_frame_is_mp3(self):
+        self.check_sniffed(b'\xff\xfb\x90\x64', tagger.Mp3Tagger)
+
+    def test_flac(self):
+        self.check_sniffed(b'fLaC\x80\x00\x00\x22', tagger.FlacTagger)
+
+    def test_ogg(self):
+        self.check_sniffed(b'OggS\x00\x02', tagger.FlacTagger)
+
+    def test_m4a(self):
+        self.check_sniffed(b'\x00\x00\x00\x20ftypM4A ', tagger.M4aTagger)
+
+    def test_unknown_content(self):
+        self.check_sniffed(b'RIFF\x00\x00\x00\x00WAVE', None)
+
+    @mock.patch('mutagen.File')
+    @mock.patch('builtins.open')
+    def test_get_tagger_uses_content_not_extension(self, mock_open, mock_file):
+        mock_open.return_value = BytesIO(b'fLaC\x80\x00\x00\x22')
+        t = tagger.get_tagger('ANY_FILE.mp3', sniff=True)
+        self.assertIsInstance(t, tagger.FlacTagger)
+
+    @mock.patch('builtins.open')
+    def test_supported_skips_unrecognized_files(self, mock_open):
+        mock_open.side_effect = [BytesIO(b'fLaC'), BytesIO(b'RIFF')]
+        with logbook.TestHandler() as log_handler:
+            fnames = list(tagger.supported(['GOOD_FILE', 'BAD_FILE'],
+                                           sniff=True))
+            self.assertTrue(log_handler.has_warning(
+                'Skipping BAD_FILE: Could not recognize content of BAD_FILE'))
+        self.assertListEqual(fnames, ['GOOD_FILE'])
+
+    def test_supported_filters_by_extension(self):
+        fnames = list(tagger.supported(['ANY_FILE.mp3', 'ANY_FILE.txt']))
+        self.assertListEqual(fnames, ['ANY_FILE.mp3'])
+
+
 class TestSetMultipleTags(TestCase):
 
     def setUp(self):
@@ -213,12 +417,44 @@ class TestSetMultipleTags(TestCase):
 
     def test_final_state_is_saved_if_any_tags_changed(self):
         tagger.set_multiple_tags('ANY_FILENAME', {'artist': 'ANY_ARTIST'})
-        self.mock_tagger.save.assert_called_once_with()
+        self.mock_tagger.save.assert_called_once_with(padding=None)
 
     def test_final_state_is_not_saved_if_no_tags_changed(self):
         tagger.set_multiple_tags('ANY_FILENAME', {})
         self.mock_tagger.save.assert_not_called()
 
+    def test_saved_tagger_is_returned(self):
+        saved = tagger.set_multiple_tags('ANY_FILENAME',
+                                         {'artist': 'ANY_ARTIST'})
+        self.assertIs(saved, self.mock_tagger)
+
+    def test_nothing_is_returned_without_save(self):
+        self.assertIsNone(tagger.set_multiple_tags('ANY_FILENAME', {}))
+
+    def test_unchanged_tags_are_not_saved(self):
+        self.mock_tagger.__getitem__.side_effect = {
+            'artist': 'ANY_ARTIST', 'bpm': '101'}.get
+        saved = tagger.set_multiple_tags('ANY_FILENAME',
+                                         {'artist': 'ANY_ARTIST',
+                                          'bpm': 101.2})
+        self.assertIsNone(saved)
+        self.mock_tagger.__setitem__.assert_not_called()
+        self.mock_tagger.save.assert_not_called()
+
+    def test_only_changed_tags_are_set(self):
+        self.mock_tagger.__getitem__.side_effect = {
+            'artist': 'ANY_ARTIST'}.get
+        tagger.set_multiple_tags('ANY_FILENAME', {'artist': 'ANY_ARTIST',
+                                                  'title': 'ANY_TITLE'})
+        self.mock_tagger.__setitem__.assert_called_once_with('title',
+                                                             'ANY_TITLE')
+        self.mock_tagger.save.assert_called_once_with(padding=None)
+
+    def test_missing_tags_are_set(self):
+        self.mock_tagger.__getitem__.side_effect = KeyError
+        tagger.set_multiple_tags('ANY_FILENAME', {'year': 1999})
+        self.mock_tagger.__setitem__.assert_called_once_with('year', 1999)
+
     def test_invalid_keys_are_ignored(self):
         tagger.set_multiple_tags('ANY_FILENAME', {'INVALID_KEY': 'ANY_VALUE'})
         self.mock_tagger.__setitem__.assert_not_called()
@@ -0,0 +1,72 @@
+from unittest import TestCase, mock
+from functools import partial
+import os
+import json
+import shutil
+import tempfile
+
+from usiq import timing, parallel, parser
+
+
+class TestProfile(TestCase):
+
+    def test_summary(self):
+        profile = timing.Profile()
+        for seconds in range(1, 101):
+            profile.add('read', seconds / 1000)
+        summary = profile.report()['phases']['read']
+        self.assertEqual(summary['count'], 100)
+        self.assertAlmostEqual(summary['p50'], 0.050, places=2)
+        self.assertAlmostEqual(summary['p95'], 0.095, places=2)
+        self.assertEqual(summary['max'], 0.1)
+
+    def test_keeps_slowest_files(self):
+        profile = timing.Profile(slowest=2)
+        profile.add('read', 0.2, 'SLOW.mp3')
+        profile.add('read', 0.1, 'FAST.mp3')
+        profile.add('save', 0.3, 'SLOWEST.mp3')
+        slowest = profile.report()['slowest']
+        self.assertListEqual([entry['file'] for entry in slowest],
+                             ['SLOWEST.mp3', 'SLOW.mp3'])
+
+
+class TestTiming(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.report = os.path.join(self.directory, 'ANY_REPORT.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def read_report(self):
+        with open(self.report) as f:
+            return json.load(f)
+
+    def test_disabled_by_default(self):
+        self.assertIsNone(timing.start())
+        timing.stop('ANY_PHASE', None)
+
+    def test_profiled_writes_report(self):
+        with timing.profiled(self.report):
+            timing.stop('read', timing.start(), 'ANY_FILE.mp3')
+        self.assertFalse(timing.enabled())
+        report = self.read_report()
+        self.assertEqual(report['phases']['read']['count'], 1)
+        self.assertEqual(report['phases']['total']['count'], 1)
+        self.assertEqual(report['slowest'][0]['file'], 'ANY_FILE.mp3')
+
+    @mock.patch('cProfile.Profile')
+    def test_cprofile_dump(self, mock_profile):
+        with timing.profiled(dump='ANY_DUMP'):
+            pass
+        mock_profile.return_value.dump_stats.assert_called_once_with(
+            'ANY_DUMP')
+
+    def test_worker_timings_are_merged(self):
+        match = partial(parser.parse_filename, pattern='<title>')
+        fnames = ['{}.mp3'.format(i) for i in range(10)]
+        with timing.profiled(self.report):
+            list(parallel.imap(match, fnames, jobs=2, chunksize=3))
+        report = self.read_report()
+        self.assertEqual(report['phases']['parse_filename']['count'], 10)
@@ -0,0 +1,156 @@
+from unittest import TestCase, mock
+import os
+import shutil
+import tempfile
+import logbook
+
+from usiq import watch, cli
+
+
+class TestWatcher(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.directory, 'ANY_SUBDIRECTORY'))
+        self.watcher = watch.Watcher(self.directory)
+
+    def tearDown(self):
+        self.watcher.close()
+        shutil.rmtree(self.directory)
+
+    def path(self, *names):
+        return os.path.join(self.directory, *names)
+
+    def write(self, *names):
+        with open(self.path(*names), 'wb') as f:
+            f.write(b'ANY_DATA')
+        return self.path(*names)
+
+    def test_reports_closed_files(self):
+        first = self.write('FIRST.mp3')
+        second = self.write('ANY_SUBDIRECTORY', 'SECOND.flac')
+        self.assertListEqual(self.watcher.read(0), [first, second])
+
+    def test_ignores_unsupported_files(self):
+        self.write('ANY_FILE.txt')
+        self.assertListEqual(self.watcher.read(0), [])
+        self.assertIsNone(self.watcher.read(0))
+
+    def test_sniff_reports_all_files(self):
+        self.watcher.sniff = True
+        fname = self.write('ANY_FILE.txt')
+        self.assertListEqual(self.watcher.read(0), [fname])
+
+    def test_watches_new_directories(self):
+        os.mkdir(self.path('NEW_DIRECTORY'))
+        self.assertListEqual(self.watcher.read(0), [])
+        fname = self.write('NEW_DIRECTORY', 'ANY_FILE.mp3')
+        self.assertListEqual(self.watcher.read(0), [fname])
+
+    def test_reports_files_of_moved_directories(self):
+        outside = tempfile.mkdtemp()
+        try:
+            open(os.path.join(outside, 'ANY_FILE.mp3'), 'w').close()
+            os.rename(outside, self.path('MOVED'))
+            self.assertListEqual(self.watcher.read(0),
+                                 [self.path('MOVED', 'ANY_FILE.mp3')])
+        finally:
+            shutil.rmtree(self.path('MOVED'), ignore_errors=True)
+
+    def test_batches_files_until_quiet(self):
+        first = self.write('FIRST.mp3')
+        second = self.write('SECOND.mp3')
+        self.write('FIRST.mp3')
+        batches = self.watcher.batches(debounce=0.01)
+        self.assertListEqual(next(batches), [first, second])
+
+    def test_discarded_files_are_not_batched(self):
+        self.write('OWN.mp3')
+        other = self.write('OTHER.mp3')
+        self.watcher.discard([self.path('OWN.mp3')])
+        batches = self.watcher.batches(debounce=0.01)
+        self.assertListEqual(next(batches), [other])
+
+
+@mock.patch('usiq.watch.Watcher')
+class TestWatch(TestCase):
+
+    def args(self, **args):
+        return dict({'--dry': False,
+                     '--import': None,
+                     '--pattern': '<artist>_-_<title>',
+                     '--target': None,
+                     '--debounce': '0.5',
+                     '--jobs': '1'}, **args)
+
+    @mock.patch('usiq.tagger.set_multiple_tags', return_value=None)
+    def test_tags_batches(self, mock_set_tags, mock_watcher):
+        mock_watcher.return_value.batches.return_value = [
+            ['/ANY_ARTIST_-_ANY_TITLE.mp3']]
+        cli.watch('ANY_DIRECTORY', self.args())
+        mock_watcher.assert_called_once_with('ANY_DIRECTORY', sniff=False)
+        mock_watcher.return_value.batches.assert_called_once_with(0.5)
+        mock_set_tags.assert_called_once_with(
+            '/ANY_ARTIST_-_ANY_TITLE.mp3',
+            {'artist': 'ANY ARTIST', 'title': 'ANY TITLE'},
+            prefix='',
+            padding=None,
+            tagr=None)
+        mock_watcher.return_value.discard.assert_called_once_with(
+            {'/ANY_ARTIST_-_ANY_TITLE.mp3'})
+        mock_watcher.return_value.close.assert_called_once_with()
+
+    @mock.patch('os.rename')
+    @mock.patch('usiq.tagger.get_tagger')
+    @mock.patch('usiq.tagger.set_multiple_tags', return_value=None)
+    def test_renames_to_target(self, mock_set_tags, mock_get_tagger,
+                               mock_rename, mock_watcher):
+        mock_watcher.return_value.batches.return_value = [
+            ['/ANY_ARTIST_-_ANY_TITLE.mp3']]
+        mock_get_tagger.return_value.todict.return_value = {
+            'artist': 'ANY_ARTIST', 'title': 'ANY_TITLE'}
+        cli.watch('ANY_DIRECTORY',
+                  self.args(**{'--target': '/<artist>/<title>'}))
+        mock_rename.assert_called_once_with('/ANY_ARTIST_-_ANY_TITLE.mp3',
+                                            '/ANY_ARTIST/ANY_TITLE.mp3')
+        mock_watcher.return_value.discard.assert_called_once_with(
+            {'/ANY_ARTIST_-_ANY_TITLE.mp3', '/ANY_ARTIST/ANY_TITLE.mp3'})
+
+    @mock.patch('usiq.tagger.set_multiple_tags', return_value=None)
+    def test_skips_files_not_matching_pattern(self, mock_set_tags,
+                                              mock_watcher):
+        mock_watcher.return_value.batches.return_value = [
+            ['/NOT MATCHING.mp3', '/ANY_ARTIST_-_ANY_TITLE.mp3']]
+        with logbook.TestHandler() as log_handler:
+            cli.watch('ANY_DIRECTORY', self.args())
+        self.assertTrue(log_handler.has_warning(
+            'Leaving /NOT MATCHING.mp3 alone, it does not match the '
+            'pattern <artist>_-_<title>'))
+        mock_set_tags.assert_called_once_with(
+            '/ANY_ARTIST_-_ANY_TITLE.mp3', mock.ANY, prefix='',
+            padding=None,
+            tagr=None)
+
+    @mock.patch('os.rename')
+    @mock.patch('usiq.tagger.get_tagger')
+    @mock.patch('usiq.tagger.set_multiple_tags', return_value=None)
+    def test_failing_batch_does_not_stop_watching(self, mock_set_tags,
+                                                  mock_get_tagger,
+                                                  mock_rename, mock_watcher):
+        mock_watcher.return_value.batches.return_value = [
+            ['/FIRST_-_ANY_TITLE.mp3'], ['/SECOND_-_ANY_TITLE.mp3']]
+        mock_get_tagger.return_value.todict.return_value = {
+            'artist': 'ANY_ARTIST', 'title': 'ANY_TITLE'}
+        mock_rename.side_effect = [OSError('ANY_ERROR'), None]
+        with logbook.TestHandler() as log_handler:
+            cli.watch('ANY_DIRECTORY',
+                      self.args(**{'--target': '/<artist>/<title>'}))
+        self.assertTrue(log_handler.has_warning(
+            'Could not process 1 new files: OSError: ANY_ERROR'))
+        self.assertEqual(mock_rename.call_count, 2)
+        self.assertEqual(mock_watcher.return_value.discard.call_count, 2)
+
+    def test_fails_for_illegal_target(self, mock_watcher):
+        with self.assertRaises(cli.UsiqError):
+            cli.watch('ANY_DIRECTORY', self.args(**{'--target': 'CONSTANT'}))
+        mock_watcher.assert_not_called()